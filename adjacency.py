@@ -0,0 +1,248 @@
+"""Parcel adjacency: an offline graph persisted next to the compiled geometry.
+
+``python adjacency.py build`` computes, village by village, which plots touch
+within ``ADJACENCY_TOLERANCE_M`` metres (digitized boundaries rarely line up
+exactly) using an STRtree in a local UTM projection, and writes the edges to
+``{GEOMETRY_CACHE_DIR}/{tehsil}.adjacency.parquet``.  At request time a
+neighbour lookup is then a dictionary read, and k-ring neighbours are a short
+breadth-first walk over it.  ``python adjacency.py export`` dumps the edges.
+
+Loaded graphs live on the tehsil's ``GeometryStore`` entry, inside its memory
+budget.  Tehsils without a built graph fall back to the per-village STRtree
+kept by ``GeometryStore``, applying the same ``ADJACENCY_TOLERANCE_M`` rule
+(measured in a local metric frame) so results do not depend on whether the
+graph has been built.
+"""
+import argparse
+import logging
+import os
+import sys
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from data_cache import build_lock, write_atomic
+from geometry_store import GEOMETRY_CACHE_DIR, compile_tehsil, list_tehsils, source_mtime
+from metrics import stage
+from plot_index import normalize_key
+
+logger = logging.getLogger(__name__)
+
+ADJACENCY_TOLERANCE_M = float(os.environ.get("ADJACENCY_TOLERANCE_M", 0.5))
+
+# Rough in-memory cost of one directed edge in the loaded graph (dict slot, tuple key, list entry)
+GRAPH_EDGE_BYTES = 160
+METRES_PER_DEGREE = 111320.0
+
+EDGE_COLUMNS = ['Village', 'Plot No.', 'Neighbour', '_village_key', '_plot_key', '_neighbour_key']
+
+
+def adjacency_path(tehsil):
+    return os.path.join(GEOMETRY_CACHE_DIR, f"{tehsil}.adjacency.parquet")
+
+
+# Edge list (both directions) of plots within ``tolerance_m`` of each other, per village
+def compute_edges(gdf, tolerance_m=ADJACENCY_TOLERANCE_M):
+    if gdf.empty or '_village_key' not in gdf.columns:
+        return pd.DataFrame(columns=EDGE_COLUMNS)
+    metric = gdf.to_crs(gdf.estimate_utm_crs())
+    frames = []
+    for vkey, village in metric.groupby('_village_key', sort=False):
+        geoms = village.geometry.values
+        tree = shapely.STRtree(geoms)
+        if tolerance_m > 0:
+            left, right = tree.query(geoms, predicate='dwithin', distance=tolerance_m)
+        else:
+            left, right = tree.query(geoms, predicate='intersects')
+        keep = (left != right) & ~shapely.equals(geoms[left], geoms[right])
+        left, right = left[keep], right[keep]
+        plots = village['_plot_key'].to_numpy()
+        labels = village['Plot No.'].to_numpy()
+        edges = pd.DataFrame({
+            'Village': village['Village'].iloc[0] if 'Village' in village.columns else vkey,
+            'Plot No.': labels[left],
+            'Neighbour': labels[right],
+            '_village_key': vkey,
+            '_plot_key': plots[left],
+            '_neighbour_key': plots[right],
+        })
+        # Several polygons can share a plot number; keep one edge per plot pair
+        edges = edges[edges['_plot_key'] != edges['_neighbour_key']]
+        frames.append(edges.drop_duplicates(['_plot_key', '_neighbour_key']))
+    if not frames:
+        return pd.DataFrame(columns=EDGE_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def _graph_tolerance(path):
+    import pyarrow.parquet as pq
+    meta = pq.read_schema(path).metadata or {}
+    value = meta.get(b'tolerance_m')
+    return float(value) if value is not None else None
+
+
+def build_adjacency(tehsil, tolerance_m=ADJACENCY_TOLERANCE_M, force=False):
+    """Compute and persist the adjacency graph of one tehsil unless an up-to-date one exists."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    source = compile_tehsil(tehsil)
+    if source is None:
+        return None
+    target = adjacency_path(tehsil)
+    mtime = os.stat(source).st_mtime_ns
+
+    def fresh():
+        return (not force and os.path.exists(target) and os.stat(target).st_mtime_ns == mtime
+                and _graph_tolerance(target) == tolerance_m)
+
+    if fresh():
+        return target
+    # Own lock file: a long graph build must not block compiles or reads of any tehsil
+    with build_lock(GEOMETRY_CACHE_DIR, f"{tehsil}.adjacency.lock"):
+        if fresh():
+            return target
+        edges = compute_edges(gpd.read_parquet(source), tolerance_m)
+        table = pa.Table.from_pandas(edges[EDGE_COLUMNS], preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), b'tolerance_m': str(tolerance_m).encode()})
+        write_atomic(target, lambda fh: pq.write_table(table, fh))
+        # Same stamp as the compiled geometry, so a new GeoJSON makes the graph stale
+        os.utime(target, ns=(mtime, mtime))
+        logger.info(f"Adjacency for {tehsil}: {len(edges)} edges within {tolerance_m} m")
+    return target
+
+
+def _local_metres(lon0, lat0):
+    # Equirectangular metres around one plot; at village scale the distortion is far below the tolerance
+    scale_x = METRES_PER_DEGREE * np.cos(np.radians(lat0))
+
+    def project(coords):
+        return np.column_stack([(coords[:, 0] - lon0) * scale_x, (coords[:, 1] - lat0) * METRES_PER_DEGREE])
+    return project
+
+
+def _load_graph(tehsil):
+    path = adjacency_path(tehsil)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    if mtime != source_mtime(tehsil):
+        return None
+    edges = pd.read_parquet(path, columns=['_village_key', '_plot_key', '_neighbour_key'])
+    graph = {}
+    for vkey, pkey, nkey in zip(edges['_village_key'], edges['_plot_key'], edges['_neighbour_key']):
+        graph.setdefault((vkey, pkey), []).append(nkey)
+    return graph
+
+
+class AdjacencyIndex:
+    def __init__(self, geometry_store, tolerance_m=ADJACENCY_TOLERANCE_M):
+        self.geometry_store = geometry_store
+        self.tolerance_m = tolerance_m
+
+    def _graph(self, tehsil):
+        # Cached on the tehsil's store entry: evicted and invalidated together with its plots
+        return self.geometry_store.attachment(
+            tehsil, 'adjacency', lambda: _load_graph(tehsil),
+            lambda graph: sum(len(v) for v in graph.values()) * GRAPH_EDGE_BYTES)
+
+    # Runtime fallback: neighbours straight from the cached village STRtree
+    def _tree_neighbours(self, tehsil, village, pkey):
+        plots, tree = self.geometry_store.village_tree(tehsil, village)
+        if plots is None or plots.empty:
+            return []
+        keys = plots['_plot_key'].to_numpy()
+        geoms = plots.geometry.values
+        selected = np.flatnonzero(keys == pkey)
+        if not len(selected):
+            return []
+        geom = geoms[selected[0]]
+        if self.tolerance_m <= 0:
+            hits = tree.query(geom, predicate='intersects')
+        else:
+            # Degree radius that over-covers the tolerance in both axes, then the exact test in metres
+            lat = geom.centroid.y
+            radius = self.tolerance_m / (METRES_PER_DEGREE * max(np.cos(np.radians(lat)), 0.01))
+            hits = tree.query(geom, predicate='dwithin', distance=radius)
+            project = _local_metres(geom.centroid.x, lat)
+            metric = shapely.transform(geoms[hits], project)
+            hits = hits[shapely.dwithin(metric, shapely.transform(geom, project), self.tolerance_m)]
+        hits = hits[~shapely.equals(geoms[hits], geom)]
+        return [k for k in dict.fromkeys(keys[hits]) if k != pkey]
+
+    def neighbours(self, tehsil, village, plotno, rings=1):
+        """``{plot_key: ring}`` of plots within ``rings`` hops of a plot (the plot itself excluded)."""
+        vkey, pkey = normalize_key(village), normalize_key(plotno)
+        graph = self._graph(tehsil)
+        if graph is not None:
+            step = lambda key: graph.get((vkey, key), [])
+        else:
+            step = lambda key: self._tree_neighbours(tehsil, village, key)
+
+        found = {pkey: 0}
+        frontier = [pkey]
+        for ring in range(1, max(int(rings), 1) + 1):
+            next_frontier = []
+            for key in frontier:
+                for neighbour in step(key):
+                    if neighbour not in found:
+                        found[neighbour] = ring
+                        next_frontier.append(neighbour)
+            frontier = next_frontier
+        del found[pkey]
+        return found
+
+    def plot_with_neighbours(self, district, tehsil, village, plotno, rings=1):
+        """``(selected, adjacent)`` plot frames, ``adjacent`` with a ``ring`` column; ``(None, None)`` without geometry."""
+        with stage('geometry_read'):
+            village_plots = self.geometry_store.get(tehsil, village)
+        if village_plots is None:
+            return None, None
+        with stage('filter'):
+            village_plots = village_plots[
+                (village_plots['_district_key'] == normalize_key(district)) &
+                (village_plots['_tehsil_key'] == normalize_key(tehsil))
+            ]
+            selected = village_plots[village_plots['_plot_key'] == normalize_key(plotno)]
+            adjacent = village_plots.iloc[:0].assign(ring=pd.Series(dtype='int64'))
+        if not selected.empty:
+            with stage('adjacency'):
+                neighbours = self.neighbours(tehsil, village, plotno, rings or 1)
+                adjacent = village_plots[village_plots['_plot_key'].isin(list(neighbours))]
+                adjacent = adjacent.assign(ring=adjacent['_plot_key'].map(neighbours))
+        return selected, adjacent
+
+
+def export_edges(tehsil, out, fmt='csv'):
+    path = build_adjacency(tehsil)
+    if path is None:
+        raise SystemExit(f"No GeoJSON for tehsil {tehsil}")
+    edges = pd.read_parquet(path, columns=['Village', 'Plot No.', 'Neighbour'])
+    if fmt == 'json':
+        edges.to_json(out, orient='records', lines=True, force_ascii=False)
+    else:
+        edges.to_csv(out, index=False)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build or export parcel adjacency graphs")
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help="compute graphs for tehsils (default: all)")
+    build.add_argument('tehsils', nargs='*')
+    build.add_argument('--tolerance', type=float, default=ADJACENCY_TOLERANCE_M, help="snapping tolerance in metres")
+    build.add_argument('--force', action='store_true')
+    export = sub.add_parser('export', help="write a tehsil's edges as CSV or JSON lines")
+    export.add_argument('tehsil')
+    export.add_argument('--format', choices=['csv', 'json'], default='csv')
+    export.add_argument('-o', '--output', help="output file (default: stdout)")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        for name in args.tehsils or list_tehsils():
+            print(build_adjacency(name, args.tolerance, force=args.force))
+    else:
+        export_edges(args.tehsil, args.output or sys.stdout, args.format)
@@ -0,0 +1,197 @@
+"""JSON ownership API on the Flask server.
+
+``/get_plot_info`` implements the contract ``templates/index.html`` expects:
+``plot_info`` (the plot's spreadsheet row), ``selected_plot`` (a GeoJSON
+Feature) and ``other_plots`` (its neighbours as Features).  It accepts a JSON
+POST body or GET query parameters; GET responses carry an ETag built from the
+data version (and the tehsil's geometry version), so unchanged plots cost a 304.
+
+``POST /api/plots/batch`` takes up to ``API_BATCH_MAX`` plot keys and streams
+one NDJSON line per key, in request order, for back-office reconciliation.
+
+``GET /api/search?q=...`` is the owner-name typeahead (see ``search.py``).
+"""
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+
+from geometry_store import source_mtime
+from map_payload import feature_collection
+
+logger = logging.getLogger(__name__)
+
+API_BATCH_MAX = int(os.environ.get("API_BATCH_MAX", 5000))
+API_SEARCH_MAX = 50
+
+# Accepted spellings of each key in request bodies and query strings
+KEY_ALIASES = {
+    'district': ('district', 'District'),
+    'tehsil': ('tehsil', 'Tehsil', 'taluka', 'Taluka'),
+    'village': ('village', 'Village'),
+    'plotno': ('plotno', 'plot_no', 'plot', 'Plot No.', 'Plot_No', 'PlotNo'),
+}
+
+
+def parse_key(payload):
+    key = {}
+    for name, aliases in KEY_ALIASES.items():
+        value = next((payload[a] for a in aliases if payload.get(a) not in (None, '')), None)
+        key[name] = None if value is None else str(value).strip()
+    return key
+
+
+def _flag(value, default):
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() not in ('0', 'false', 'no', '')
+    return bool(value)
+
+
+def _rings(value):
+    try:
+        return max(int(value or 1), 1)
+    except (TypeError, ValueError):
+        return 1
+
+
+def _json_value(value):
+    if pd.api.types.is_scalar(value) and pd.isna(value):
+        return None
+    # Arrow/numpy date and duration cells: .item() would give bare nanosecond ints
+    if isinstance(value, np.datetime64):
+        value = pd.Timestamp(value)
+    elif isinstance(value, np.timedelta64):
+        value = pd.Timedelta(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    value = value.item() if hasattr(value, 'item') else value
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    # Decimal, bytes and other scalars JSON has no type for
+    return str(value)
+
+
+class PlotInfoService:
+    def __init__(self, df, plot_index, adjacency_index, data_version, search_index=None):
+        self.df = df
+        self.plot_index = plot_index
+        self.adjacency_index = adjacency_index
+        self.data_version = data_version
+        self.search_index = search_index
+
+    def etag(self, key, geometry=True):
+        version = self.data_version
+        if geometry and key.get('tehsil'):
+            mtime = source_mtime(key['tehsil'])
+            version = f"{version}-{'none' if mtime is None else format(mtime, 'x')}"
+        return version
+
+    def lookup(self, key, geometry=True, rings=1):
+        """Response body for one plot key, or ``None`` if the plot is unknown."""
+        if not all(key.values()):
+            return None
+        rows = self.plot_index.rows(key['district'], key['tehsil'], key['village'], key['plotno'])
+        if not rows:
+            return None
+        row = self.df.iloc[rows[0]]
+        result = {
+            'plot_info': {col: _json_value(row[col]) for col in self.df.columns},
+            'selected_plot': None,
+            'other_plots': [],
+        }
+        if not geometry:
+            return result
+
+        selected, adjacent = self.adjacency_index.plot_with_neighbours(
+            key['district'], key['tehsil'], key['village'], key['plotno'], rings)
+        if selected is not None and not selected.empty:
+            result['selected_plot'] = feature_collection(selected.iloc[:1])[0]['features'][0]
+            result['other_plots'] = feature_collection(adjacent, properties=('Plot No.', 'ring'))[0]['features']
+        return result
+
+
+def create_blueprint(service):
+    api = Blueprint('api', __name__)
+
+    @api.route('/get_plot_info', methods=['GET', 'POST'])
+    def get_plot_info():
+        payload = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args
+        if request.method == 'POST' and not isinstance(payload, dict):
+            return jsonify({'error': "expected a JSON object"}), 400
+        key = parse_key(payload)
+        missing = [name for name, value in key.items() if not value]
+        if missing:
+            return jsonify({'error': f"missing {', '.join(missing)}"}), 400
+        geometry = _flag(payload.get('geometry'), True)
+        rings = _rings(payload.get('rings'))
+
+        etag = service.etag(key, geometry)
+        if request.method == 'GET' and request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            result = service.lookup(key, geometry, rings)
+            if result is None:
+                return jsonify({'error': "plot not found", **key}), 404
+            response = jsonify(result)
+        if request.method == 'GET':
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = "no-cache"
+        response.headers['X-Data-Version'] = service.data_version
+        return response
+
+    @api.route('/api/plots/batch', methods=['POST'])
+    def plots_batch():
+        payload = request.get_json(silent=True) or {}
+        items = payload.get('plots') if isinstance(payload, dict) else None
+        if not isinstance(items, list):
+            return jsonify({'error': "expected a JSON object with a 'plots' list"}), 400
+        if len(items) > API_BATCH_MAX:
+            return jsonify({'error': f"at most {API_BATCH_MAX} plots per batch"}), 413
+        geometry = _flag(payload.get('geometry'), False)
+        rings = _rings(payload.get('rings'))
+
+        def generate():
+            for item in items:
+                key = parse_key(item if isinstance(item, dict) else {})
+                # Headers are already sent: a bad row must become an error line, not end the stream
+                try:
+                    result = service.lookup(key, geometry, rings)
+                    if result is None:
+                        result = {'error': "plot not found"}
+                    line = json.dumps({'key': key, **result}, ensure_ascii=False)
+                except Exception as e:
+                    logger.error(f"Batch lookup failed for {key}: {str(e)}")
+                    line = json.dumps({'key': key, 'error': str(e)}, ensure_ascii=False)
+                yield line + '\n'
+
+        response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        response.headers['X-Data-Version'] = service.data_version
+        return response
+
+    @api.route('/api/search')
+    def search():
+        if service.search_index is None:
+            return jsonify({'error': "search is not available"}), 404
+        try:
+            limit = min(max(int(request.args.get('limit', 10)), 1), API_SEARCH_MAX)
+        except ValueError:
+            limit = 10
+        query = request.args.get('q', '')
+        response = jsonify({'query': query, 'results': service.search_index.results(query, limit)})
+        response.set_etag(f"{service.data_version}-{hashlib.sha1(f'{query}|{limit}'.encode()).hexdigest()[:12]}")
+        response.headers['Cache-Control'] = "no-cache"
+        return response.make_conditional(request)
+
+    @api.route('/api/version')
+    def version():
+        response = jsonify({'data_version': service.data_version})
+        response.set_etag(service.data_version)
+        return response.make_conditional(request)
+
+    return api
@@ -1,69 +1,68 @@
 import dash
-from dash import html, dcc, Input, Output, State
+from dash import html, dcc, Input, Output, State, ClientsideFunction
+from dash.exceptions import PreventUpdate
 import dash_leaflet as dl
+from dash_extensions.javascript import Namespace
 import pandas as pd
-import geopandas as gpd
 import json
 import os
 import logging
 from shapely.geometry import Polygon, MultiPolygon
 
+import data_cache
+from adjacency import AdjacencyIndex
+from api import PlotInfoService, create_blueprint as api_blueprint
+from atlas import AtlasBuilder, create_blueprint as atlas_blueprint
+from geometry_store import GeometryStore
+from map_payload import encode, feature_collection, fit_zoom
+from metrics import create_blueprint as metrics_blueprint, instrument, stage
+from plot_index import PlotIndex, normalize_key
+from vector_tiles import TileCache, create_blueprint as tiles_blueprint
+
 # Setup logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-# Load Excel data
+# Load Excel data (compiled once into a memory-mapped columnar cache, see data_cache.py)
 def load_excel_data():
-    folder_path = "data"
-    all_dataframes = []
-    for file in os.listdir(folder_path):
-        if file.endswith(".xlsx"):
-            df = pd.read_excel(os.path.join(folder_path, file))
-            if 'Taluka' in df.columns:
-                df.rename(columns={'Taluka': 'Tehsil'}, inplace=True)
-            if 'Plot_No' in df.columns or 'PlotNo' in df.columns:
-                df.rename(columns={'Plot_No': 'Plot No.', 'PlotNo': 'Plot No.'}, inplace=True)
-            all_dataframes.append(df)
-    if all_dataframes:
-        df = pd.concat(all_dataframes, ignore_index=True)
-        df['Plot No.'] = df['Plot No.'].astype(str).str.strip()
-        logger.info(f"Excel data loaded with {len(df)} rows. Columns: {df.columns.tolist()}")
-        return df
-    logger.error("No Excel files found in data folder")
-    return pd.DataFrame()
-
-df = load_excel_data()
-
-# Load GeoJSON
-def load_geojson(tehsil):
-    geojson_file = f"geojson/{tehsil}.geojson"
-    logger.debug(f"Checking GeoJSON file: {geojson_file}")
-    if not os.path.exists(geojson_file):
-        logger.error(f"GeoJSON file not found: {geojson_file}")
-        return None
-    try:
-        gdf = gpd.read_file(geojson_file)
-        logger.info(f"Loaded GeoJSON with {len(gdf)} features. CRS: {gdf.crs}")
-        gdf = gdf[gdf.geometry.notnull() & gdf.geometry.is_valid]
-
-        if gdf.crs != "EPSG:4326":
-            logger.info("Reprojecting to EPSG:4326")
-            gdf = gdf.to_crs(epsg=4326)
-
-        if 'Taluka' in gdf.columns:
-            gdf.rename(columns={'Taluka': 'Tehsil'}, inplace=True)
-        if 'Plot_No' in gdf.columns or 'PlotNo' in gdf.columns:
-            gdf.rename(columns={'Plot_No': 'Plot No.', 'PlotNo': 'Plot No.'}, inplace=True)
-        gdf['Plot No.'] = gdf['Plot No.'].astype(str).str.strip()
-
-        return gdf
-    except Exception as e:
-        logger.error(f"Error loading GeoJSON {geojson_file}: {str(e)}")
-        return None
+    with stage('data_load', callback='startup'):
+        df, version = data_cache.load_ownership_data()
+    if df.empty:
+        logger.error("No Excel files found in data folder")
+        return df, version
+    logger.info(f"Excel data {version} loaded with {len(df)} rows. Columns: {df.columns.tolist()}")
+    return df, version
+
+df, data_version = load_excel_data()
+plot_index = PlotIndex(df)
+search_index = data_cache.load_search_index(df, data_version)
+
+# Load GeoJSON (validated, in EPSG:4326 and cached per tehsil, see geometry_store.py)
+geometry_store = GeometryStore()
+
+# Plot + neighbour lookup (offline adjacency graph, falling back to per-village STRtrees, see adjacency.py)
+adjacency_index = AdjacencyIndex(geometry_store)
 
 # Initialize Dash
 app = dash.Dash(__name__)
 app.title = "Khasra Dashboard"
+server = app.server
+
+# Parcel vector tiles for the whole-tehsil overlay
+tile_cache = TileCache(geometry_store)
+server.register_blueprint(tiles_blueprint(tile_cache))
+
+# JSON ownership API (/get_plot_info and batch NDJSON lookups)
+server.register_blueprint(api_blueprint(PlotInfoService(df, plot_index, adjacency_index, data_version, search_index)))
+
+# Background PDF atlas exports (POST /api/atlas)
+server.register_blueprint(atlas_blueprint(AtlasBuilder(df, plot_index, adjacency_index, data_version)))
+
+# Callback latency histograms, counters and response sizes (GET /metrics)
+server.register_blueprint(metrics_blueprint())
+
+# Client-side functions from assets/dashExtensions_default.js
+js_functions = Namespace("dashExtensions", "default")
 
 # Layout
 app.layout = html.Div([ 
@@ -83,10 +82,12 @@ app.layout = html.Div([
     html.H2("Land Ownership Explorer", style={'textAlign': 'center', 'color': '#2c3e50'}),
     html.Div([
         html.Div([
+            html.Label("Search Owner Name", style={'fontWeight': 'bold'}),
+            dcc.Dropdown(id='owner-search', placeholder="Type an owner name", options=[], style={'marginBottom': '10px'}),
             html.Label("Select District", style={'fontWeight': 'bold'}),
             dcc.Dropdown(
                 id='district-dropdown',
-                options=[{'label': dist, 'value': dist} for dist in sorted(df['District'].dropna().unique())],
+                options=plot_index.district_options(),
                 placeholder="Select District",
                 style={'marginBottom': '10px'}
             ),
@@ -96,6 +97,9 @@ app.layout = html.Div([
             dcc.Dropdown(id='village-dropdown', placeholder="Select Village", style={'marginBottom': '10px'}),
             html.Label("Select Plot No.", style={'fontWeight': 'bold'}),
             dcc.Dropdown(id='plotno-dropdown', placeholder="Select Plot No.", style={'marginBottom': '10px'}),
+            html.Label("Neighbour Rings", style={'fontWeight': 'bold'}),
+            dcc.Dropdown(id='rings-dropdown', options=[{'label': str(k), 'value': k} for k in (1, 2, 3)],
+                         value=1, clearable=False, style={'marginBottom': '10px'}),
 
             html.Button("Show Khasra", id='show-khasra-button', n_clicks=0, style={
                 'width': '100%', 'padding': '10px', 'backgroundColor': '#2c3e50', 'color': 'white',
@@ -116,7 +120,10 @@ app.layout = html.Div([
         ], style={'width': '30%', 'padding': '20px', 'backgroundColor': '#f5f5f5', 'borderRadius': '5px'}),
 
         html.Div([
-            dl.Map(id='map', center=[17.123, 75.644], zoom=16, children=[
+            dcc.Store(id='parcel-tiles-tehsil'),
+            dl.Map(id='map', center=[17.123, 75.644], zoom=16, eventHandlers={
+                'load': js_functions("function3"), 'moveend': js_functions("function3")
+            }, children=[
                 dl.TileLayer(
                     url="https://{s}.google.com/vt/lyrs=s&x={x}&y={y}&z={z}",
                     attribution="© Google Maps",
@@ -131,30 +138,94 @@ app.layout = html.Div([
 
 # Callbacks for dropdowns
 @app.callback(Output('tehsil-dropdown', 'options'), Input('district-dropdown', 'value'))
+@instrument('update_tehsils')
 def update_tehsils(district):
     if not district:
         return []
-    return [{'label': t, 'value': t} for t in sorted(df[df['District'] == district]['Tehsil'].dropna().unique())]
+    with stage('filter'):
+        return plot_index.tehsil_options(district)
 
 @app.callback(
     Output('village-dropdown', 'options'),
     [Input('district-dropdown', 'value'), Input('tehsil-dropdown', 'value')]
 )
+@instrument('update_villages')
 def update_villages(district, tehsil):
     if not (district and tehsil):
         return []
-    dff = df[(df['District'] == district) & (df['Tehsil'] == tehsil)]
-    return [{'label': v, 'value': v} for v in sorted(dff['Village'].dropna().unique())]
+    with stage('filter'):
+        return plot_index.village_options(district, tehsil)
 
 @app.callback(
     Output('plotno-dropdown', 'options'),
     [Input('district-dropdown', 'value'), Input('tehsil-dropdown', 'value'), Input('village-dropdown', 'value')]
 )
+@instrument('update_plotnos')
 def update_plotnos(district, tehsil, village):
     if not (district and tehsil and village):
         return []
-    dff = df[(df['District'] == district) & (df['Tehsil'] == tehsil) & (df['Village'] == village)]
-    return [{'label': p, 'value': p} for p in sorted(dff['Plot No.'].dropna())]
+    with stage('filter'):
+        return plot_index.plot_options(district, tehsil, village)
+
+# Parcel overlay follows the selected tehsil (tiles are fetched by the browser)
+app.clientside_callback(
+    ClientsideFunction(namespace='parcels', function_name='show_tehsil'),
+    Output('parcel-tiles-tehsil', 'data'),
+    Input('tehsil-dropdown', 'value')
+)
+
+# Owner-name typeahead, answered from the search index
+@app.callback(
+    Output('owner-search', 'options'),
+    Input('owner-search', 'search_value'),
+    State('owner-search', 'value'),
+    State('owner-search', 'options')
+)
+def update_owner_search(search_value, value, options):
+    if not search_value:
+        raise PreventUpdate
+    results = search_index.results(search_value, 10)
+    # 'search' keeps Dash's client-side label filter from hiding transliterated matches
+    new_options = [{
+        'label': f"{r['owner']} ({r['village']}, Plot {r['plotno']})",
+        'value': json.dumps([r['district'], r['tehsil'], r['village'], r['plotno']]),
+        'search': search_value
+    } for r in results]
+    selected = [o for o in options or [] if o['value'] == value and o['value'] not in {n['value'] for n in new_options}]
+    return selected + new_options
+
+def _option_value(options, value):
+    return next((o['value'] for o in options if normalize_key(o['value']) == normalize_key(value)), value)
+
+# Picking a search result fills the dropdowns and shows the plot and its ownership
+@app.callback(
+    Output('district-dropdown', 'value'),
+    Output('tehsil-dropdown', 'options', allow_duplicate=True),
+    Output('tehsil-dropdown', 'value'),
+    Output('village-dropdown', 'options', allow_duplicate=True),
+    Output('village-dropdown', 'value'),
+    Output('plotno-dropdown', 'options', allow_duplicate=True),
+    Output('plotno-dropdown', 'value'),
+    Output('show-khasra-button', 'n_clicks'),
+    Output('show-ownership-button', 'n_clicks'),
+    Input('owner-search', 'value'),
+    State('show-khasra-button', 'n_clicks'),
+    State('show-ownership-button', 'n_clicks'),
+    prevent_initial_call=True
+)
+def select_owner_search_result(value, khasra_clicks, ownership_clicks):
+    if not value:
+        raise PreventUpdate
+    district, tehsil, village, plotno = json.loads(value)
+    district = _option_value(plot_index.district_options(), district)
+    tehsils = plot_index.tehsil_options(district)
+    tehsil = _option_value(tehsils, tehsil)
+    villages = plot_index.village_options(district, tehsil)
+    village = _option_value(villages, village)
+    plots = plot_index.plot_options(district, tehsil, village)
+    plotno = _option_value(plots, plotno)
+    return (district, tehsils, tehsil, villages, village, plots, plotno,
+            (khasra_clicks or 0) + 1, (ownership_clicks or 0) + 1)
 
 # Show Ownership button: Only show plot info
 @app.callback(
@@ -165,17 +236,14 @@ def update_plotnos(district, tehsil, village):
     State('village-dropdown', 'value'),
     State('plotno-dropdown', 'value')
 )
+@instrument('show_ownership_info')
 def show_ownership_info(n_clicks, district, tehsil, village, plotno):
     if not n_clicks or not all([district, tehsil, village, plotno]):
         return "Please select all options."
-    row = df[(
-        df['District'].str.strip().str.lower() == str(district).strip().lower()) &
-        (df['Tehsil'].str.strip().str.lower() == str(tehsil).strip().lower()) &
-        (df['Village'].str.strip().str.lower() == str(village).strip().lower()) &
-        (df['Plot No.'] == str(plotno).strip())
-    ]
-    if not row.empty and 'Plot Info' in row.columns and not pd.isna(row['Plot Info'].values[0]):
-        return row['Plot Info'].values[0]
+    with stage('filter'):
+        rows = plot_index.rows(district, tehsil, village, plotno)
+    if rows and 'Plot Info' in df.columns and not pd.isna(df['Plot Info'].iat[rows[0]]):
+        return df['Plot Info'].iat[rows[0]]
     return "No ownership information available."
 
 # Show Khasra button: Plot + Adjacent Polygons
@@ -185,55 +253,41 @@ def show_ownership_info(n_clicks, district, tehsil, village, plotno):
     State('district-dropdown', 'value'),
     State('tehsil-dropdown', 'value'),
     State('village-dropdown', 'value'),
-    State('plotno-dropdown', 'value')
+    State('plotno-dropdown', 'value'),
+    State('rings-dropdown', 'value'),
+    State('map', 'zoom')
 )
-def update_map_with_adjacent_polygons(n_clicks, district, tehsil, village, plotno):
+@instrument('update_map_with_adjacent_polygons')
+def update_map_with_adjacent_polygons(n_clicks, district, tehsil, village, plotno, rings=1, zoom=None):
     if not n_clicks or not all([district, tehsil, village, plotno]):
         return [], [17.123, 75.644]
 
-    gdf = load_geojson(tehsil)
-    if gdf is None:
+    # Selected plot and its neighbours (k rings out) from the adjacency graph
+    # (timed there as geometry_read / filter / adjacency stages)
+    selected_plot, adjacent = adjacency_index.plot_with_neighbours(district, tehsil, village, plotno, rings)
+    if selected_plot is None:
         return [], [17.123, 75.644]
 
-    village_plots = gdf[(
-        gdf['District'].str.strip().str.lower() == str(district).strip().lower()) &
-        (gdf['Tehsil'].str.strip().str.lower() == str(tehsil).strip().lower()) &
-        (gdf['Village'].str.strip().str.lower() == str(village).strip().lower())
-    ]
-    selected_plot = village_plots[village_plots['Plot No.'] == str(plotno).strip()]
     map_center = [17.123, 75.644]
-    
     if not selected_plot.empty:
         bounds = selected_plot.geometry.iloc[0].bounds
         map_center = [(bounds[1] + bounds[3]) / 2, (bounds[0] + bounds[2]) / 2]
 
-    # Identify adjacent polygons
-    adjacent_polygons = []
-    if not selected_plot.empty:
-        selected_geometry = selected_plot.geometry.iloc[0]
-        for _, row in village_plots.iterrows():
-            if row.geometry.intersects(selected_geometry) and not row.geometry.equals(selected_geometry):
-                adjacent_polygons.append(row)
-
-    # Construct geojson for selected plot and adjacent polygons
-    selected_geojson = {'type': 'FeatureCollection', 'features': []}
-    adjacent_geojson = {'type': 'FeatureCollection', 'features': []}
-
+    # Simplify/quantize for the zoom the plot will be shown at
+    detail_zoom = zoom
     if not selected_plot.empty:
-        geojson_geom = json.loads(gpd.GeoSeries([selected_plot.geometry.iloc[0]]).to_json())
-        feature = {
-            'type': 'Feature',
-            'geometry': geojson_geom['features'][0]['geometry'],
-            'properties': {'Plot No.': str(plotno)}
-        }
-        selected_geojson['features'].append(feature)
+        detail_zoom = max(zoom or 0, fit_zoom(selected_plot.geometry.iloc[0].bounds))
 
     # Add selected plot GeoJSON layer
     layers = []
-    if selected_geojson['features']:
+    if not selected_plot.empty:
+        with stage('serialization'):
+            selected_geojson, decimals = feature_collection(selected_plot.iloc[:1], detail_zoom)
+            data, fmt = encode(selected_geojson, decimals)
         layers.append(
             dl.GeoJSON(
-                data=selected_geojson,
+                data=data,
+                format=fmt,
                 id="selected-geojson-data",
                 zoomToBounds=True,
                 options={
@@ -243,24 +297,18 @@ def update_map_with_adjacent_polygons(n_clicks, district, tehsil, village, plotn
             )
         )
 
-    # Add adjacent polygons GeoJSON layers
-    for adj in adjacent_polygons:
-        geojson_geom = json.loads(gpd.GeoSeries([adj.geometry]).to_json())
-        feature = {
-            'type': 'Feature',
-            'geometry': geojson_geom['features'][0]['geometry'],
-            'properties': {'Plot No.': adj['Plot No.']}
-        }
-        adjacent_geojson['features'].append(feature)
-
+    # Add all adjacent polygons as one layer, styled and labelled client-side
+    if not adjacent.empty:
+        with stage('serialization'):
+            adjacent_geojson, decimals = feature_collection(adjacent, detail_zoom, properties=('Plot No.', 'ring'))
+            data, fmt = encode(adjacent_geojson, decimals)
         layers.append(
             dl.GeoJSON(
-                data=feature,
-                id=f"adjacent-geojson-data-{adj['Plot No.']}",
-                options={
-                    "style": {"color": "blue", "weight": 3, "fillOpacity": 0.3, "fillColor": "#0000FF"}
-                },
-                children=[dl.Popup([html.Div(f"Plot No: {adj['Plot No.']}")])]
+                data=data,
+                format=fmt,
+                id="adjacent-geojson-data",
+                style=js_functions("function1"),
+                onEachFeature=js_functions("function2")
             )
         )
 
@@ -4,6 +4,26 @@ window.dashExtensions = Object.assign({}, window.dashExtensions, {
             return {
                 color: '#FF0000'
             };
+        },
+        // Adjacent plots: first ring solid blue, further rings fainter
+        function1: function(feature) {
+            const ring = feature.properties.ring || 1;
+            return {
+                color: ring > 1 ? '#5DADE2' : 'blue',
+                weight: ring > 1 ? 2 : 3,
+                fillOpacity: ring > 1 ? 0.15 : 0.3,
+                fillColor: ring > 1 ? '#5DADE2' : '#0000FF'
+            };
+        },
+        // Popup text goes in as a text node, never as HTML from the data
+        function2: function(feature, layer) {
+            const content = document.createElement('div');
+            content.textContent = 'Plot No: ' + feature.properties['Plot No.'];
+            layer.bindPopup(content);
+        },
+        // Map event handler: hand the Leaflet map to the parcel tile overlay (assets/parcel_tiles.js)
+        function3: function(e) {
+            window.khasraParcels.attach(e.target);
         }
     }
-});
\ No newline at end of file
+});
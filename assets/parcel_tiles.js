@@ -0,0 +1,84 @@
+// Whole-tehsil parcel overlay from the /tiles/{tehsil}/{z}/{x}/{y}.pbf endpoint.
+// Leaflet.VectorGrid needs the L global that dash-leaflet creates, so it is
+// loaded lazily once the map has reported itself through its event handlers.
+window.khasraParcels = {
+    map: null,
+    layer: null,
+    tehsil: null,
+    loading: false,
+    pluginUrl: 'https://unpkg.com/leaflet.vectorgrid@1.3.0/dist/Leaflet.VectorGrid.bundled.min.js',
+
+    attach: function(map) {
+        if (this.map === map) {
+            return;
+        }
+        this.map = map;
+        this.refresh();
+    },
+
+    show: function(tehsil) {
+        this.tehsil = tehsil || null;
+        this.refresh();
+    },
+
+    refresh: function() {
+        if (!this.map) {
+            return;
+        }
+        if (!(window.L && L.vectorGrid)) {
+            this.loadPlugin();
+            return;
+        }
+        if (this.layer) {
+            this.map.removeLayer(this.layer);
+            this.layer = null;
+        }
+        if (!this.tehsil) {
+            return;
+        }
+        this.layer = L.vectorGrid.protobuf('/tiles/' + encodeURIComponent(this.tehsil) + '/{z}/{x}/{y}.pbf', {
+            minZoom: 10,
+            maxNativeZoom: 20,
+            maxZoom: 22,
+            interactive: true,
+            vectorTileLayerStyles: {
+                parcels: {weight: 1, color: '#f1c40f', opacity: 0.9, fill: true, fillOpacity: 0}
+            }
+        });
+        this.layer.on('click', function(e) {
+            // Tile properties are data, not markup: set them as text nodes
+            const content = document.createElement('div');
+            content.appendChild(document.createTextNode('Plot No: ' + e.layer.properties.plot));
+            if (e.layer.properties.village) {
+                content.appendChild(document.createElement('br'));
+                content.appendChild(document.createTextNode(e.layer.properties.village));
+            }
+            L.popup().setLatLng(e.latlng).setContent(content).openOn(e.target._map);
+        });
+        this.layer.addTo(this.map);
+        this.layer.bringToBack();
+    },
+
+    loadPlugin: function() {
+        if (this.loading || !window.L) {
+            return;
+        }
+        this.loading = true;
+        const script = document.createElement('script');
+        script.src = this.pluginUrl;
+        script.onload = () => {
+            this.loading = false;
+            this.refresh();
+        };
+        document.head.appendChild(script);
+    }
+};
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    parcels: {
+        show_tehsil: function(tehsil) {
+            window.khasraParcels.show(tehsil);
+            return tehsil || null;
+        }
+    }
+});
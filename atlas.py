@@ -0,0 +1,359 @@
+"""Server-side PDF ownership atlas: one page per plot, rendered without a browser.
+
+Each page shows the plot (green), its adjacent plots (blue, labelled) and the
+plot's ownership text, drawn headlessly with matplotlib/shapely.  Pages are
+rendered across a process pool from plain WKB/text tasks, cached as PNGs under
+``{ATLAS_CACHE_DIR}/pages/{version}/`` (version = Excel data version plus the
+tehsil's GeoJSON mtime) and merged into one PDF with reportlab.
+
+CLI:  ``python atlas.py --district Sangli --tehsil Jat [--village Achkanhalli]``
+HTTP: ``POST /api/atlas`` starts a background export and returns a job id;
+``GET /api/atlas/<job>`` reports progress and ``GET /api/atlas/<job>/pdf``
+downloads the result.  Job state lives on disk so any gunicorn worker can
+answer for it; the exporting process records its pid and a heartbeat there,
+and a job whose owner has died (timeout, recycle, deploy) is restarted by the
+next ``POST``, reusing the pages already rendered.
+
+Devanagari owner names need a font that covers the script: set ``ATLAS_FONT``
+to its path (e.g. Noto Sans Devanagari).  matplotlib does not shape
+conjuncts, so complex clusters render as their component letters.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import textwrap
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import shapely
+from flask import Blueprint, jsonify, request, send_file, url_for
+
+from data_cache import build_lock, write_atomic
+from geometry_store import source_mtime
+from plot_index import normalize_key
+
+logger = logging.getLogger(__name__)
+
+ATLAS_CACHE_DIR = os.environ.get("ATLAS_CACHE_DIR", os.path.join("cache", "atlas"))
+ATLAS_WORKERS = int(os.environ.get("ATLAS_WORKERS", 0)) or os.cpu_count() or 1
+ATLAS_FONT = os.environ.get("ATLAS_FONT")
+ATLAS_DPI = 110
+# Running jobs refresh their heartbeat this often (seconds); one silent for ATLAS_JOB_STALE is dead
+ATLAS_HEARTBEAT = 10
+ATLAS_JOB_STALE = int(os.environ.get("ATLAS_JOB_STALE", 120))
+
+# Ownership text lines that fit under the map on an A4 page
+MAX_TEXT_LINES = 38
+A4_INCHES = (8.27, 11.69)
+
+
+# --- Rendering (runs in the worker processes) ------------------------------
+
+def _font_properties():
+    if not ATLAS_FONT:
+        return None
+    from matplotlib.font_manager import FontProperties
+    return FontProperties(fname=ATLAS_FONT)
+
+
+def _ownership_lines(text):
+    lines = []
+    for raw in str(text or "No ownership information available.").splitlines():
+        lines.extend(textwrap.wrap(raw, 100) or [''])
+    if len(lines) > MAX_TEXT_LINES:
+        hidden = len(lines) - MAX_TEXT_LINES + 1
+        lines = lines[:MAX_TEXT_LINES - 1] + [f"... ({hidden} more lines)"]
+    return lines
+
+
+def render_page(task):
+    """Render one plot page to ``task['path']`` (PNG); returns the path."""
+    import warnings
+    import matplotlib
+    matplotlib.use('Agg')
+    # Without ATLAS_FONT every Devanagari glyph would warn on every page
+    warnings.filterwarnings('ignore', message='Glyph .* missing from font')
+    import matplotlib.pyplot as plt
+    from shapely.plotting import plot_polygon
+
+    font = _font_properties()
+    fig = plt.figure(figsize=A4_INCHES, dpi=ATLAS_DPI)
+    fig.text(0.05, 0.965, task['title'], fontsize=13, fontweight='bold', fontproperties=font)
+
+    ax = fig.add_axes([0.05, 0.42, 0.9, 0.52])
+    selected = shapely.from_wkb(task['selected'])
+    neighbours = shapely.from_wkb(task['neighbours']) if task['neighbours'] else []
+    for geom, label in zip(neighbours, task['neighbour_labels']):
+        plot_polygon(geom, ax=ax, add_points=False, color='#3498db', facecolor='#d6eaf8', linewidth=0.8)
+        point = geom.representative_point()
+        ax.annotate(label, (point.x, point.y), ha='center', va='center', fontsize=7, color='#1b4f72')
+    plot_polygon(selected, ax=ax, add_points=False, color='#1e8449', facecolor='#82e0aa', linewidth=2)
+    point = selected.representative_point()
+    ax.annotate(task['plotno'], (point.x, point.y), ha='center', va='center', fontsize=10, fontweight='bold')
+    # Plots are in EPSG:4326; scale x so shapes are not stretched at this latitude
+    ax.set_aspect(1 / max(np.cos(np.radians(point.y)), 0.1))
+    ax.set_axis_off()
+
+    fig.text(0.05, 0.395, "Ownership", fontsize=11, fontweight='bold')
+    fig.text(0.05, 0.385, '\n'.join(_ownership_lines(task['text'])), fontsize=7.5, va='top',
+             family='monospace' if font is None else None, fontproperties=font)
+    write_atomic(task['path'], lambda fh: fig.savefig(fh, format='png', dpi=ATLAS_DPI))
+    plt.close(fig)
+    return task['path']
+
+
+def merge_pages(paths, out_path):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    tmp = f"{out_path}.tmp"
+    pdf = canvas.Canvas(tmp, pagesize=A4)
+    for path in paths:
+        pdf.drawImage(path, 0, 0, width=A4[0], height=A4[1])
+        pdf.showPage()
+    pdf.save()
+    os.replace(tmp, out_path)
+    return out_path
+
+
+# --- Building tasks and exports --------------------------------------------
+
+def _digest(*parts):
+    return hashlib.sha1('\0'.join(str(p) for p in parts).encode()).hexdigest()[:20]
+
+
+class AtlasBuilder:
+    def __init__(self, df, plot_index, adjacency_index, data_version, cache_dir=ATLAS_CACHE_DIR):
+        self.df = df
+        self.plot_index = plot_index
+        self.adjacency_index = adjacency_index
+        self.geometry_store = adjacency_index.geometry_store
+        self.data_version = data_version
+        self.cache_dir = cache_dir
+        self._job_lock = threading.Lock()
+
+    def version(self, tehsil):
+        mtime = source_mtime(tehsil)
+        return f"{self.data_version}-{'none' if mtime is None else format(mtime, 'x')}"
+
+    def villages(self, district, tehsil, village=None):
+        if village:
+            return [village]
+        return [o['value'] for o in self.plot_index.village_options(district, tehsil)]
+
+    def tasks(self, district, tehsil, village=None):
+        """Page tasks (picklable dicts) for every plot with geometry in a village or tehsil."""
+        version = self.version(tehsil)
+        page_dir = os.path.join(self.cache_dir, "pages", version)
+        os.makedirs(page_dir, exist_ok=True)
+        tasks = []
+        for name in self.villages(district, tehsil, village):
+            plots = self.geometry_store.get(tehsil, name)
+            if plots is None or plots.empty:
+                continue
+            plots = plots[plots['_district_key'] == normalize_key(district)]
+            wkb = shapely.to_wkb(plots.geometry.values)
+            labels = plots['Plot No.'].to_numpy()
+            positions = {}
+            for i, key in enumerate(plots['_plot_key']):
+                positions.setdefault(key, i)
+
+            for option in self.plot_index.plot_options(district, tehsil, name):
+                plotno = option['value']
+                selected = positions.get(normalize_key(plotno))
+                if selected is None:
+                    continue
+                neighbours = [positions[k] for k in self.adjacency_index.neighbours(tehsil, name, plotno)
+                              if k in positions]
+                rows = self.plot_index.rows(district, tehsil, name, plotno)
+                text = self.df['Plot Info'].iat[rows[0]] if rows and 'Plot Info' in self.df.columns else None
+                tasks.append({
+                    'path': os.path.join(page_dir, f"{_digest(district, tehsil, name, plotno)}.png"),
+                    'title': f"{district} / {tehsil} / {name} - Plot No. {plotno}",
+                    'plotno': str(plotno),
+                    'selected': wkb[selected],
+                    'neighbours': [wkb[i] for i in neighbours],
+                    'neighbour_labels': [str(labels[i]) for i in neighbours],
+                    'text': None if text is None or pd.isna(text) else str(text),
+                })
+        return tasks
+
+    def pdf_path(self, district, tehsil, village=None):
+        scope = '_'.join(p for p in (district, tehsil, village) if p)
+        safe = ''.join(c if c.isalnum() or c in '-_' else '_' for c in scope)
+        return os.path.join(self.cache_dir, "exports", f"{safe}-{self.version(tehsil)}.pdf")
+
+    def export(self, district, tehsil, village=None, workers=ATLAS_WORKERS, progress=None):
+        """Render (or reuse) every page and merge them; returns the PDF path."""
+        out_path = self.pdf_path(district, tehsil, village)
+        if os.path.exists(out_path):
+            return out_path
+        tasks = self.tasks(district, tehsil, village)
+        if not tasks:
+            raise ValueError(f"No plots with geometry for {district} / {tehsil} / {village or 'all villages'}")
+        todo = [t for t in tasks if not os.path.exists(t['path'])]
+        logger.info(f"Atlas {out_path}: {len(tasks)} pages, {len(todo)} to render on {workers} workers")
+        done = len(tasks) - len(todo)
+        if progress:
+            progress(done, len(tasks))
+        if todo:
+            # spawn: never fork a threaded web worker
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                for _ in pool.map(render_page, todo, chunksize=max(1, min(32, len(todo) // (workers * 4)))):
+                    done += 1
+                    if progress and done % 25 == 0:
+                        progress(done, len(tasks))
+        merge_pages([t['path'] for t in tasks], out_path)
+        if progress:
+            progress(len(tasks), len(tasks))
+        return out_path
+
+    # --- Background jobs, shared between workers through the job files ---
+
+    def _job_path(self, job_id):
+        return os.path.join(self.cache_dir, "jobs", f"{job_id}.json")
+
+    def job(self, job_id):
+        try:
+            with open(self._job_path(job_id)) as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def _save_job(self, job_id, **state):
+        # Progress and heartbeat threads both update the file; keep read-modify-write atomic
+        with self._job_lock:
+            job = {**(self.job(job_id) or {}), **state}
+            os.makedirs(os.path.dirname(self._job_path(job_id)), exist_ok=True)
+            write_atomic(self._job_path(job_id), lambda fh: fh.write(json.dumps(job).encode()))
+        return job
+
+    @staticmethod
+    def is_stale(job):
+        """True for a ``running`` job whose owning process is gone or has stopped its heartbeat."""
+        if job.get('status') != 'running':
+            return False
+        if time.time() - job.get('heartbeat', 0) > ATLAS_JOB_STALE:
+            return True
+        if job.get('host') == socket.gethostname() and job.get('pid'):
+            try:
+                os.kill(job['pid'], 0)
+            except ProcessLookupError:
+                return True
+            except PermissionError:
+                pass
+        return False
+
+    def start_job(self, district, tehsil, village=None):
+        job_id = _digest(district, tehsil, village or '', self.version(tehsil))
+        os.makedirs(os.path.dirname(self._job_path(job_id)), exist_ok=True)
+        # Claim under a file lock so two workers cannot both restart a dead job
+        with build_lock(os.path.dirname(self._job_path(job_id)), f"{job_id}.lock"):
+            job = self.job(job_id)
+            if job and (job['status'] == 'done' or (job['status'] == 'running' and not self.is_stale(job))):
+                return job_id, job
+            if job and job['status'] == 'running':
+                logger.warning(f"Atlas job {job_id} owned by pid {job.get('pid')} is stale, restarting it")
+            job = self._save_job(job_id, id=job_id, status='running', done=0, total=None, error=None,
+                                 district=district, tehsil=tehsil, village=village,
+                                 pid=os.getpid(), host=socket.gethostname(), heartbeat=time.time())
+
+        finished = threading.Event()
+
+        def heartbeat():
+            while not finished.wait(ATLAS_HEARTBEAT):
+                self._save_job(job_id, heartbeat=time.time())
+
+        def run():
+            threading.Thread(target=heartbeat, name=f"atlas-{job_id}-heartbeat", daemon=True).start()
+            try:
+                path = self.export(district, tehsil, village,
+                                   progress=lambda done, total: self._save_job(
+                                       job_id, done=done, total=total, heartbeat=time.time()))
+                finished.set()
+                self._save_job(job_id, status='done', path=path)
+            except Exception as e:
+                finished.set()
+                logger.error(f"Atlas job {job_id} failed: {str(e)}")
+                self._save_job(job_id, status='failed', error=str(e))
+
+        threading.Thread(target=run, name=f"atlas-{job_id}", daemon=True).start()
+        return job_id, job
+
+
+def create_blueprint(builder):
+    atlas = Blueprint('atlas', __name__)
+
+    def describe(job_id, job):
+        if builder.is_stale(job):
+            job = {**job, 'status': 'failed', 'error': "export worker exited; POST /api/atlas again to resume"}
+        body = {k: v for k, v in job.items() if k not in ('path', 'pid', 'host', 'heartbeat')}
+        body['status_url'] = url_for('atlas.atlas_status', job_id=job_id)
+        if job.get('status') == 'done':
+            body['pdf_url'] = url_for('atlas.atlas_pdf', job_id=job_id)
+        return body
+
+    @atlas.route('/api/atlas', methods=['POST'])
+    def atlas_start():
+        payload = request.get_json(silent=True) or {}
+        if not isinstance(payload, dict):
+            return jsonify({'error': "expected a JSON object"}), 400
+        district, tehsil, village = (payload.get(k) for k in ('district', 'tehsil', 'village'))
+        if not (district and tehsil):
+            return jsonify({'error': "district and tehsil are required"}), 400
+        if not all(isinstance(v, str) for v in (district, tehsil, village or '')):
+            return jsonify({'error': "district, tehsil and village must be strings"}), 400
+        job_id, job = builder.start_job(district, tehsil, village or None)
+        return jsonify(describe(job_id, job)), 202
+
+    @atlas.route('/api/atlas/<job_id>')
+    def atlas_status(job_id):
+        job = builder.job(job_id)
+        if job is None:
+            return jsonify({'error': "unknown job"}), 404
+        return jsonify(describe(job_id, job))
+
+    @atlas.route('/api/atlas/<job_id>/pdf')
+    def atlas_pdf(job_id):
+        job = builder.job(job_id)
+        if job is None or job.get('status') != 'done' or not os.path.exists(job.get('path', '')):
+            return jsonify({'error': "atlas not ready"}), 404
+        return send_file(os.path.abspath(job['path']), mimetype='application/pdf', as_attachment=True,
+                         download_name=os.path.basename(job['path']))
+
+    return atlas
+
+
+if __name__ == '__main__':
+    import data_cache
+    from adjacency import AdjacencyIndex
+    from geometry_store import GeometryStore
+    from plot_index import PlotIndex
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Export a per-plot ownership atlas PDF for a village or tehsil")
+    parser.add_argument('--district', required=True)
+    parser.add_argument('--tehsil', required=True)
+    parser.add_argument('--village', help="one village (default: every village in the tehsil)")
+    parser.add_argument('--workers', type=int, default=ATLAS_WORKERS)
+    parser.add_argument('-o', '--output', help="copy the PDF here")
+    args = parser.parse_args()
+
+    df, version = data_cache.load_ownership_data()
+    index = PlotIndex(df)
+    builder = AtlasBuilder(df, index, AdjacencyIndex(GeometryStore()), version)
+    path = builder.export(args.district, args.tehsil, args.village, workers=args.workers)
+    if args.output:
+        import shutil
+        shutil.copyfile(path, args.output)
+        path = args.output
+    print(path)
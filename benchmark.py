@@ -0,0 +1,325 @@
+"""Synthetic-load benchmark for the Dash callbacks.
+
+``python benchmark.py generate --out bench --parcels 100000 --villages 40``
+writes a synthetic tehsil: ``bench/geojson/{tehsil}.geojson`` (a jittered grid
+of parcels whose neighbours share vertices exactly, so adjacency behaves like
+digitized cadastre) and one ``bench/data/{village}.xlsx`` per village with a
+matching ``Plot Info`` row for every parcel.
+
+``python benchmark.py run --data bench --sessions 200`` replays user sessions
+against the Dash callback endpoint (``/_dash-update-component``): pick a
+district, taluka, village and plot from the options the server returns, then
+click Show Ownership and Show Khasra.  Without ``--url`` the app is imported
+in-process on the generated data (its caches under ``bench/cache``) and driven
+through Flask's test client; with ``--url`` a running server is hit over HTTP.
+It reports p50/p95/p99 latency and response sizes per callback.
+``--save`` writes the summary as JSON and ``--compare`` fails (exit 1) when
+a p95 regresses by more than ``--tolerance`` against a saved summary.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+DEFAULT_DISTRICT = "Benchdist"
+DEFAULT_TEHSIL = "Benchtehsil"
+ORIGIN = (75.60, 17.10)  # lon, lat of the grid's south-west corner
+CELL_DEGREES = 0.001  # ~100 m parcels
+
+FIRST_NAMES = ['अमित', 'सुमीत', 'राजेंद्र', 'सुनिता', 'महादेव', 'विठ्ठल', 'शांताबाई', 'गणेश', 'Sunil', 'Ramesh']
+MIDDLE_NAMES = ['दादासाहेब', 'शिवाजी', 'बाबुराव', 'पांडुरंग', 'तुकाराम', 'Maruti']
+SURNAMES = ['शिंदे', 'पाटील', 'जाधव', 'पवार', 'कांबळे', 'माने', 'Kulkarni', 'Deshmukh']
+
+
+# --- Synthetic data --------------------------------------------------------
+
+def _plot_info(rng, plotno):
+    entries = []
+    for sub in range(1, rng.randint(1, 4) + 1):
+        owners = ', '.join(
+            f"{rng.choice(FIRST_NAMES)} {rng.choice(MIDDLE_NAMES)} {rng.choice(SURNAMES)}"
+            for _ in range(rng.randint(1, 3)))
+        entries.append(
+            f"Survey No. : {plotno}/{sub}\nTotal Area : {rng.uniform(0, 3):.4f}\n"
+            f"Pot kharaba : {rng.uniform(0, 1):.4f}\nOwner Name : {owners}\nKhata No. : {rng.randint(1, 5000)}")
+    return '\n\n'.join(entries)
+
+
+def generate(out, parcels, villages, district=DEFAULT_DISTRICT, tehsil=DEFAULT_TEHSIL, seed=0):
+    """Write a synthetic tehsil GeoJSON and per-village workbooks under ``out``."""
+    import pandas as pd
+
+    rng = random.Random(seed)
+    cols = math.ceil(math.sqrt(parcels))
+    rows = math.ceil(parcels / cols)
+    villages = max(1, min(villages, cols))
+
+    # Shared, jittered grid vertices: adjacent parcels meet on identical edges
+    jitter = np.random.default_rng(seed).uniform(-0.2, 0.2, size=(rows + 1, cols + 1, 2)) * CELL_DEGREES
+    jitter[[0, -1], :, :] = 0
+    jitter[:, [0, -1], :] = 0
+    xs = ORIGIN[0] + np.arange(cols + 1) * CELL_DEGREES
+    ys = ORIGIN[1] + np.arange(rows + 1) * CELL_DEGREES
+    grid = np.stack(np.meshgrid(xs, ys), axis=-1) + jitter
+
+    os.makedirs(os.path.join(out, "geojson"), exist_ok=True)
+    os.makedirs(os.path.join(out, "data"), exist_ok=True)
+    names = [f"Village {i + 1:03d}" for i in range(villages)]
+    counters = [0] * villages
+    records = {name: [] for name in names}
+
+    with open(os.path.join(out, "geojson", f"{tehsil}.geojson"), 'w') as fh:
+        fh.write('{"type": "FeatureCollection", "crs": {"type": "name", "properties": '
+                 '{"name": "urn:ogc:def:crs:OGC:1.3:CRS84"}}, "features": [\n')
+        for n in range(parcels):
+            r, c = divmod(n, cols)
+            v = c * villages // cols  # villages are vertical bands of the grid
+            counters[v] += 1
+            plotno = str(counters[v])
+            ring = [grid[r, c], grid[r, c + 1], grid[r + 1, c + 1], grid[r + 1, c], grid[r, c]]
+            feature = {
+                'type': 'Feature',
+                'properties': {'District': district, 'Taluka': tehsil, 'Village': names[v], 'Plot_No': plotno},
+                'geometry': {'type': 'Polygon', 'coordinates': [[[round(x, 7), round(y, 7)] for x, y in ring]]},
+            }
+            fh.write(('' if n == 0 else ',\n') + json.dumps(feature))
+            records[names[v]].append({'District': district, 'Taluka': tehsil, 'Village': names[v],
+                                      'Plot No.': plotno, 'Plot Info': _plot_info(rng, plotno)})
+        fh.write('\n]}\n')
+
+    for name, rows_ in records.items():
+        pd.DataFrame(rows_).to_excel(os.path.join(out, "data", f"{name}.xlsx"), index=False)
+    return sum(counters)
+
+
+# --- Replaying sessions ----------------------------------------------------
+
+def _find_component(node, component_id):
+    if isinstance(node, dict):
+        if node.get('props', {}).get('id') == component_id:
+            return node
+        children = [node.get('props', {}).get('children')] if 'props' in node else list(node.values())
+        for child in children:
+            found = _find_component(child, component_id)
+            if found is not None:
+                return found
+    elif isinstance(node, list):
+        for child in node:
+            found = _find_component(child, component_id)
+            if found is not None:
+                return found
+    return None
+
+
+def _callback_body(outputs, inputs, state=()):
+    outputs = [dict(zip(('id', 'property'), o)) for o in outputs]
+    if len(outputs) == 1:
+        output, outputs = f"{outputs[0]['id']}.{outputs[0]['property']}", outputs[0]
+    else:
+        output = '..' + '...'.join(f"{o['id']}.{o['property']}" for o in outputs) + '..'
+    return {
+        'output': output,
+        'outputs': outputs,
+        'inputs': [{'id': i, 'property': p, 'value': v} for i, p, v in inputs],
+        'state': [{'id': i, 'property': p, 'value': v} for i, p, v in state],
+        'changedPropIds': [f"{i}.{p}" for i, p, _ in inputs[:1]],
+    }
+
+
+class HttpClient:
+    def __init__(self, url):
+        import requests
+        self.url = url.rstrip('/')
+        self._local = threading.local()
+        self._requests = requests
+
+    def _session(self):
+        if not hasattr(self._local, 'session'):
+            self._local.session = self._requests.Session()
+        return self._local.session
+
+    def get_json(self, path):
+        return self._session().get(self.url + path).json()
+
+    def post(self, path, body):
+        response = self._session().post(self.url + path, json=body)
+        return response.status_code, response.content
+
+
+class InProcessClient:
+    def __init__(self, data):
+        # Point the app at the generated data before it is imported
+        os.environ.setdefault("DATA_DIR", os.path.join(data, "data"))
+        os.environ.setdefault("GEOJSON_DIR", os.path.join(data, "geojson"))
+        for name, sub in (("DATA_CACHE_DIR", "ownership"), ("GEOMETRY_CACHE_DIR", "geometry"),
+                          ("TILE_CACHE_DIR", "tiles"), ("ATLAS_CACHE_DIR", "atlas")):
+            os.environ.setdefault(name, os.path.join(data, "cache", sub))
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import app
+        self.server = app.server
+        self._local = threading.local()
+
+    def _client(self):
+        if not hasattr(self._local, 'client'):
+            self._local.client = self.server.test_client()
+        return self._local.client
+
+    def get_json(self, path):
+        return self._client().get(path).get_json()
+
+    def post(self, path, body):
+        response = self._client().post(path, json=body)
+        return response.status_code, response.get_data()
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def call(self, client, name, body):
+        start = time.perf_counter()
+        status, content = client.post('/_dash-update-component', body)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            if status >= 400:
+                self.errors[name] = self.errors.get(name, 0) + 1
+            self.samples.setdefault(name, []).append((elapsed, len(content)))
+        if status != 200:
+            return None
+        return json.loads(content)['response']
+
+    def summary(self):
+        out = {}
+        for name, samples in sorted(self.samples.items()):
+            seconds = np.array([s for s, _ in samples]) * 1000
+            sizes = np.array([b for _, b in samples])
+            out[name] = {
+                'count': len(samples), 'errors': self.errors.get(name, 0),
+                'p50_ms': float(np.percentile(seconds, 50)), 'p95_ms': float(np.percentile(seconds, 95)),
+                'p99_ms': float(np.percentile(seconds, 99)), 'max_ms': float(seconds.max()),
+                'mean_bytes': float(sizes.mean()), 'p95_bytes': float(np.percentile(sizes, 95)),
+                'max_bytes': int(sizes.max()),
+            }
+        return out
+
+
+def _options(response, component):
+    return [o['value'] for o in (response or {}).get(component, {}).get('options') or []]
+
+
+def run_session(client, recorder, districts, rng, rings=1, zoom=16):
+    """One dropdown-then-click session; returns False if the server offered nothing to pick."""
+    district = rng.choice(districts)
+    tehsils = _options(recorder.call(client, 'update_tehsils', _callback_body(
+        [('tehsil-dropdown', 'options')], [('district-dropdown', 'value', district)])), 'tehsil-dropdown')
+    if not tehsils:
+        return False
+    tehsil = rng.choice(tehsils)
+    villages = _options(recorder.call(client, 'update_villages', _callback_body(
+        [('village-dropdown', 'options')],
+        [('district-dropdown', 'value', district), ('tehsil-dropdown', 'value', tehsil)])), 'village-dropdown')
+    if not villages:
+        return False
+    village = rng.choice(villages)
+    plots = _options(recorder.call(client, 'update_plotnos', _callback_body(
+        [('plotno-dropdown', 'options')],
+        [('district-dropdown', 'value', district), ('tehsil-dropdown', 'value', tehsil),
+         ('village-dropdown', 'value', village)])), 'plotno-dropdown')
+    if not plots:
+        return False
+    plotno = rng.choice(plots)
+
+    selection = [('district-dropdown', 'value', district), ('tehsil-dropdown', 'value', tehsil),
+                 ('village-dropdown', 'value', village), ('plotno-dropdown', 'value', plotno)]
+    recorder.call(client, 'show_ownership_info', _callback_body(
+        [('plot-info', 'children')], [('show-ownership-button', 'n_clicks', 1)], selection))
+    recorder.call(client, 'update_map_with_adjacent_polygons', _callback_body(
+        [('geojson-layer', 'children'), ('map', 'center')], [('show-khasra-button', 'n_clicks', 1)],
+        selection + [('rings-dropdown', 'value', rings), ('map', 'zoom', zoom)]))
+    return True
+
+
+def run(client, sessions, concurrency=1, warmup=0, rings=1, seed=0):
+    layout = client.get_json('/_dash-layout')
+    district_dropdown = _find_component(layout, 'district-dropdown')
+    districts = [o['value'] for o in (district_dropdown or {}).get('props', {}).get('options') or []]
+    if not districts:
+        raise SystemExit("The app offers no districts; is the data folder empty?")
+
+    for i in range(warmup):
+        run_session(client, Recorder(), districts, random.Random(f"warmup-{seed}-{i}"), rings)
+
+    recorder = Recorder()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda i: run_session(client, recorder, districts, random.Random(f"{seed}-{i}"), rings),
+                      range(sessions)))
+    return recorder.summary(), time.perf_counter() - start
+
+
+def print_summary(summary, elapsed, sessions):
+    print(f"{sessions} sessions in {elapsed:.1f}s")
+    print(f"{'callback':36} {'n':>6} {'err':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'mean KB':>8} {'max KB':>8}")
+    for name, s in summary.items():
+        print(f"{name:36} {s['count']:6d} {s['errors']:4d} {s['p50_ms']:8.1f} {s['p95_ms']:8.1f} "
+              f"{s['p99_ms']:8.1f} {s['mean_bytes'] / 1024:8.1f} {s['max_bytes'] / 1024:8.1f}")
+
+
+def compare(summary, baseline, tolerance):
+    regressions = []
+    for name, s in summary.items():
+        before = baseline.get(name)
+        if before and s['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']:.1f} -> {s['p95_ms']:.1f} ms")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate synthetic tehsils and benchmark the Dash callbacks")
+    sub = parser.add_subparsers(dest='command', required=True)
+    gen = sub.add_parser('generate')
+    gen.add_argument('--out', default="bench")
+    gen.add_argument('--parcels', type=int, default=10000, help="number of parcels (up to 100k and beyond)")
+    gen.add_argument('--villages', type=int, default=20)
+    gen.add_argument('--district', default=DEFAULT_DISTRICT)
+    gen.add_argument('--tehsil', default=DEFAULT_TEHSIL)
+    gen.add_argument('--seed', type=int, default=0)
+    bench = sub.add_parser('run')
+    bench.add_argument('--data', default="bench", help="folder written by 'generate' (in-process mode)")
+    bench.add_argument('--url', help="benchmark a running server instead, e.g. http://localhost:10000")
+    bench.add_argument('--sessions', type=int, default=100)
+    bench.add_argument('--concurrency', type=int, default=1)
+    bench.add_argument('--warmup', type=int, default=0, help="sessions run first and left out of the stats")
+    bench.add_argument('--rings', type=int, default=1)
+    bench.add_argument('--seed', type=int, default=0)
+    bench.add_argument('--save', help="write the summary as JSON")
+    bench.add_argument('--compare', help="summary JSON to compare p95 latencies against")
+    bench.add_argument('--tolerance', type=float, default=0.25, help="allowed p95 regression (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        count = generate(args.out, args.parcels, args.villages, args.district, args.tehsil, args.seed)
+        print(f"Wrote {count} parcels to {args.out}")
+        sys.exit(0)
+
+    client = HttpClient(args.url) if args.url else InProcessClient(args.data)
+    summary, elapsed = run(client, args.sessions, args.concurrency, args.warmup, args.rings, args.seed)
+    print_summary(summary, elapsed, args.sessions)
+    if args.save:
+        with open(args.save, 'w') as fh:
+            json.dump(summary, fh, indent=2)
+    if args.compare:
+        with open(args.compare) as fh:
+            regressions = compare(summary, json.load(fh), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,277 @@
+"""Compiled columnar cache for the Excel ownership data.
+
+Every workbook in the data folder is parsed once, normalized (Taluka -> Tehsil,
+Plot_No/PlotNo -> Plot No., key columns stripped) and written as an Arrow IPC
+"part" named after the workbook's content hash and the cache format version.  A manifest records each
+source's mtime, size and sha256, so only workbooks that actually changed are
+parsed again.  The parts are then concatenated into a single uncompressed
+Arrow file which workers open with ``pyarrow.memory_map``: the column buffers
+live in the OS page cache and are shared by every gunicorn worker instead of
+being copied per process.  The owner-search index (``search.py``) is built in
+the same step and saved next to it as ``search-{version}-v{format}/``, so
+workers memory-map it instead of rebuilding it at import.
+
+Run ``python data_cache.py`` to (re)build the cache ahead of time; otherwise
+the first worker to start builds it under a file lock and the rest wait.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover - cache is optional, fall back to openpyxl
+    pa = None
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows dev boxes run a single process
+    fcntl = None
+
+from search import SEARCH_FORMAT, OwnerSearchIndex
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.environ.get("DATA_DIR", "data")
+CACHE_DIR = os.environ.get("DATA_CACHE_DIR", os.path.join("cache", "ownership"))
+
+# Bump when the normalization below changes so stale parts get recompiled
+FORMAT_VERSION = 1
+
+KEY_COLUMNS = ['District', 'Tehsil', 'Village', 'Plot No.']
+
+
+# Normalize one workbook's frame the same way the dashboard expects it
+def normalize_frame(df):
+    if 'Taluka' in df.columns:
+        df = df.rename(columns={'Taluka': 'Tehsil'})
+    if 'Plot_No' in df.columns or 'PlotNo' in df.columns:
+        df = df.rename(columns={'Plot_No': 'Plot No.', 'PlotNo': 'Plot No.'})
+    if 'Plot No.' in df.columns:
+        df['Plot No.'] = df['Plot No.'].astype(str).str.strip()
+    for col in ('District', 'Tehsil', 'Village'):
+        if col in df.columns:
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str).str.strip())
+    # Excel columns often mix numbers and text; Arrow needs one type per column
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].map(lambda v: v if pd.isna(v) else str(v))
+    return df
+
+
+def read_workbook(path):
+    return normalize_frame(pd.read_excel(path))
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def list_workbooks(data_dir):
+    if not os.path.isdir(data_dir):
+        return []
+    return sorted(f for f in os.listdir(data_dir) if f.endswith(".xlsx") and not f.startswith("~$"))
+
+
+def _read_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, "manifest.json")) as fh:
+            manifest = json.load(fh)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('format') != FORMAT_VERSION:
+        return {}
+    return manifest
+
+
+def write_atomic(path, write):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            write(fh)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def _write_arrow(path, table):
+    # Uncompressed IPC so readers can memory-map the buffers without copying
+    def write(fh):
+        with pa.ipc.new_file(fh, table.schema) as writer:
+            writer.write_table(table)
+    write_atomic(path, write)
+
+
+def _read_arrow(path):
+    return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+
+@contextmanager
+def build_lock(cache_dir, name=".lock"):
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(cache_dir, name), 'w') as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+# Work out which sources are unchanged, hashing only files whose mtime/size moved
+def _scan_sources(data_dir, manifest):
+    known = manifest.get('sources', {})
+    sources = {}
+    for name in list_workbooks(data_dir):
+        st = os.stat(os.path.join(data_dir, name))
+        entry = known.get(name)
+        if entry and entry['mtime_ns'] == st.st_mtime_ns and entry['size'] == st.st_size:
+            sources[name] = dict(entry)
+            continue
+        sha = file_sha256(os.path.join(data_dir, name))
+        sources[name] = {'mtime_ns': st.st_mtime_ns, 'size': st.st_size, 'sha256': sha}
+        if entry and entry.get('sha256') == sha and 'part' in entry:
+            sources[name]['part'] = entry['part']
+    return sources
+
+
+def _version_of(sources):
+    digest = hashlib.sha256(f"format={FORMAT_VERSION}".encode())
+    for name in sorted(sources):
+        digest.update(f"\0{name}\0{sources[name]['sha256']}".encode())
+    return digest.hexdigest()[:16]
+
+
+def _search_name(version):
+    return f"search-{version}-v{SEARCH_FORMAT}"
+
+
+def _is_fresh(cache_dir, manifest, sources):
+    if not manifest or manifest.get('version') != _version_of(sources):
+        return False
+    if manifest.get('search') != _search_name(manifest['version']):
+        return False
+    return (os.path.exists(os.path.join(cache_dir, manifest['combined']))
+            and os.path.isdir(os.path.join(cache_dir, manifest['search'])))
+
+
+def _concat_parts(tables):
+    try:
+        return pa.concat_tables(tables, promote_options="permissive")
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        # A column is text in one workbook and numeric in another: keep it as text
+        return pa.concat_tables(
+            [t.cast(pa.schema([pa.field(f.name, pa.string()) for f in t.schema])) for t in tables],
+            promote_options="permissive",
+        )
+
+
+def build_cache(data_dir=DATA_DIR, cache_dir=CACHE_DIR, force=False):
+    """Recompile changed workbooks and rewrite the combined file; returns the manifest."""
+    if pa is None:
+        raise RuntimeError("pyarrow is required to build the ownership cache")
+    parts_dir = os.path.join(cache_dir, "parts")
+    os.makedirs(parts_dir, exist_ok=True)
+
+    with build_lock(cache_dir):
+        manifest = {} if force else _read_manifest(cache_dir)
+        sources = _scan_sources(data_dir, manifest)
+        if not force and _is_fresh(cache_dir, manifest, sources):
+            if sources != manifest.get('sources'):
+                # Touched but byte-identical workbooks: just record the new mtimes
+                manifest['sources'] = sources
+                write_atomic(os.path.join(cache_dir, "manifest.json"),
+                              lambda fh: fh.write(json.dumps(manifest, indent=1).encode()))
+            return manifest
+
+        tables = []
+        for name, entry in sources.items():
+            # The format is part of the name: a FORMAT_VERSION bump reparses every workbook
+            part = f"{entry['sha256'][:24]}-v{FORMAT_VERSION}.arrow"
+            part_path = os.path.join(parts_dir, part)
+            if force or not os.path.exists(part_path):
+                logger.info(f"Compiling {name}")
+                frame = read_workbook(os.path.join(data_dir, name))
+                _write_arrow(part_path, pa.Table.from_pandas(frame, preserve_index=False))
+            entry['part'] = part
+            tables.append(_read_arrow(part_path))
+
+        version = _version_of(sources)
+        combined = f"ownership-{version}.arrow"
+        table = _concat_parts(tables) if tables else pa.table({})
+        _write_arrow(os.path.join(cache_dir, combined), table)
+
+        search = _search_name(version)
+        if force or not os.path.isdir(os.path.join(cache_dir, search)):
+            shutil.rmtree(os.path.join(cache_dir, search), ignore_errors=True)
+            OwnerSearchIndex(table.to_pandas(types_mapper=pd.ArrowDtype)).save(os.path.join(cache_dir, search))
+
+        manifest = {'format': FORMAT_VERSION, 'version': version, 'combined': combined, 'search': search,
+                    'rows': table.num_rows, 'sources': sources}
+        write_atomic(os.path.join(cache_dir, "manifest.json"),
+                      lambda fh: fh.write(json.dumps(manifest, indent=1).encode()))
+
+        # Unlinking is safe for workers that still have the old files mapped
+        live = {combined, search} | {entry['part'] for entry in sources.values()}
+        for folder in (cache_dir, parts_dir):
+            for f in os.listdir(folder):
+                if f.endswith(".arrow") and f not in live:
+                    os.unlink(os.path.join(folder, f))
+        for f in os.listdir(cache_dir):
+            if f.startswith("search-") and f not in live:
+                shutil.rmtree(os.path.join(cache_dir, f), ignore_errors=True)
+        logger.info(f"Ownership cache {version} built with {table.num_rows} rows from {len(sources)} workbooks")
+        return manifest
+
+
+def load_ownership_data(data_dir=DATA_DIR, cache_dir=CACHE_DIR):
+    """Return ``(df, version)``; ``version`` changes whenever any workbook's content does."""
+    if pa is None:
+        logger.warning("pyarrow not installed, parsing Excel workbooks directly")
+        sources = {name: {'sha256': file_sha256(os.path.join(data_dir, name))} for name in list_workbooks(data_dir)}
+        frames = [read_workbook(os.path.join(data_dir, name)) for name in sources]
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        return df, _version_of(sources)
+
+    manifest = build_cache(data_dir, cache_dir)
+    table = _read_arrow(os.path.join(cache_dir, manifest['combined']))
+    # ArrowDtype keeps the columns backed by the mapped buffers (no per-worker copy)
+    df = table.to_pandas(types_mapper=pd.ArrowDtype)
+    return df, manifest['version']
+
+
+def load_search_index(df, version, cache_dir=CACHE_DIR):
+    """The owner-search index saved for ``version`` by ``build_cache``; built in-process if there is none."""
+    path = os.path.join(cache_dir, _search_name(version))
+    if pa is not None and os.path.isdir(path):
+        try:
+            return OwnerSearchIndex.load(path, df)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not open search index {path}, rebuilding it in memory: {str(e)}")
+    return OwnerSearchIndex(df)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Compile data/*.xlsx into the memory-mapped ownership cache")
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--force', action='store_true', help="recompile every workbook")
+    args = parser.parse_args()
+    result = build_cache(args.data_dir, args.cache_dir, force=args.force)
+    print(f"version {result['version']}: {result['rows']} rows from {len(result['sources'])} workbooks")
@@ -0,0 +1,301 @@
+"""Processed tehsil geometries: an on-disk GeoParquet form plus a bounded in-process LRU.
+
+``geojson/{tehsil}.geojson`` is compiled once into ``{GEOMETRY_CACHE_DIR}/{tehsil}.parquet``:
+invalid and empty geometries dropped, reprojected to EPSG:4326, Taluka/Plot_No
+columns renamed, and normalized ``_district_key``/``_tehsil_key``/``_village_key``/
+``_plot_key`` columns added.  Rows are sorted by village and written with a
+GeoParquet bbox covering column, so a read can be pushed down to one village
+instead of parsing the whole tehsil.  The compiled file carries the source's
+mtime and is rebuilt when the GeoJSON changes; builds lock per tehsil, so one
+slow compile never holds up reads of another tehsil.
+
+``GeometryStore`` keeps what has been read in an LRU keyed by tehsil, bounded
+by ``GEOMETRY_CACHE_MB`` and invalidated by the source mtime.  Data derived
+from a tehsil (its adjacency graph) can be attached to the same entry, so it
+counts against the budget and goes when the tehsil does.
+"""
+import argparse
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import geopandas as gpd
+import shapely
+
+from data_cache import build_lock, write_atomic
+from metrics import GEOMETRY_READS
+from plot_index import normalize_key
+
+logger = logging.getLogger(__name__)
+
+GEOJSON_DIR = os.environ.get("GEOJSON_DIR", "geojson")
+GEOMETRY_CACHE_DIR = os.environ.get("GEOMETRY_CACHE_DIR", os.path.join("cache", "geometry"))
+GEOMETRY_CACHE_MB = int(os.environ.get("GEOMETRY_CACHE_MB", 256))
+
+KEY_COLUMNS = {'District': '_district_key', 'Tehsil': '_tehsil_key', 'Village': '_village_key', 'Plot No.': '_plot_key'}
+
+try:
+    import pyarrow.parquet  # noqa: F401 - GeoParquet needs pyarrow
+    HAS_PARQUET = True
+except ImportError:  # pragma: no cover
+    HAS_PARQUET = False
+
+
+def source_path(tehsil):
+    # Tehsil names come from requests, never let them escape the geojson folder
+    name = str(tehsil)
+    if not name or name.startswith('.') or '/' in name or '\\' in name:
+        return None
+    return os.path.join(GEOJSON_DIR, f"{name}.geojson")
+
+
+def compiled_path(tehsil):
+    return os.path.join(GEOMETRY_CACHE_DIR, f"{tehsil}.parquet")
+
+
+def list_tehsils():
+    if not os.path.isdir(GEOJSON_DIR):
+        return []
+    return sorted(f[:-len(".geojson")] for f in os.listdir(GEOJSON_DIR) if f.endswith(".geojson"))
+
+
+# Same clean-up load_geojson used to do on every click, plus normalized key columns
+def normalize_geometries(gdf):
+    gdf = gdf[gdf.geometry.notnull() & gdf.geometry.is_valid & ~gdf.geometry.is_empty]
+
+    if gdf.crs != "EPSG:4326":
+        logger.info("Reprojecting to EPSG:4326")
+        gdf = gdf.to_crs(epsg=4326)
+
+    if 'Taluka' in gdf.columns:
+        gdf = gdf.rename(columns={'Taluka': 'Tehsil'})
+    if 'Plot_No' in gdf.columns or 'PlotNo' in gdf.columns:
+        gdf = gdf.rename(columns={'Plot_No': 'Plot No.', 'PlotNo': 'Plot No.'})
+    gdf = gdf.copy()
+    gdf['Plot No.'] = gdf['Plot No.'].astype(str).str.strip()
+
+    for col, key in KEY_COLUMNS.items():
+        if col in gdf.columns:
+            gdf[key] = gdf[col].astype(str).str.strip().str.lower()
+    if '_village_key' in gdf.columns:
+        gdf = gdf.sort_values(['_village_key', '_plot_key'], kind='stable')
+    return gdf.reset_index(drop=True)
+
+
+def read_source(tehsil):
+    path = source_path(tehsil)
+    gdf = gpd.read_file(path)
+    logger.info(f"Loaded GeoJSON with {len(gdf)} features. CRS: {gdf.crs}")
+    return normalize_geometries(gdf)
+
+
+def source_mtime(tehsil):
+    path = source_path(tehsil)
+    try:
+        return os.stat(path).st_mtime_ns if path else None
+    except OSError:
+        return None
+
+
+def compile_tehsil(tehsil, force=False):
+    """Write the GeoParquet form of one tehsil if it is missing or older than its GeoJSON."""
+    mtime = source_mtime(tehsil)
+    if mtime is None:
+        return None
+    target = compiled_path(tehsil)
+
+    def fresh():
+        return not force and os.path.exists(target) and os.stat(target).st_mtime_ns == mtime
+
+    # Up-to-date files are the common case and need no lock; re-check once we hold it
+    if fresh():
+        return target
+    os.makedirs(GEOMETRY_CACHE_DIR, exist_ok=True)
+    with build_lock(GEOMETRY_CACHE_DIR, f"{tehsil}.lock"):
+        if fresh():
+            return target
+        gdf = read_source(tehsil)
+        # Small row groups keep village/bbox reads from touching the rest of the tehsil
+        write_atomic(target, lambda fh: gdf.to_parquet(fh, write_covering_bbox=True, row_group_size=2048))
+        # Stamp the compiled file with the source mtime; any edit to the GeoJSON invalidates it
+        os.utime(target, ns=(mtime, mtime))
+        logger.info(f"Compiled {source_path(tehsil)} to {target} ({len(gdf)} features)")
+    return target
+
+
+def _estimate_bytes(gdf):
+    if gdf.empty:
+        return 0
+    attrs = gdf.drop(columns=gdf.geometry.name).memory_usage(deep=True).sum()
+    coords = shapely.get_num_coordinates(gdf.geometry.values).sum()
+    return int(attrs + coords * 16 + len(gdf) * 120)
+
+
+class _Entry:
+    def __init__(self, mtime):
+        self.mtime = mtime
+        self.villages = {}
+        self.full = None
+        self.trees = {}
+        self.extras = {}
+        self.nbytes = 0
+        self.extra_nbytes = 0
+
+
+class GeometryStore:
+    def __init__(self, budget_mb=GEOMETRY_CACHE_MB):
+        self.budget = budget_mb * 1024 * 1024
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.RLock()
+
+    def get(self, tehsil, village=None):
+        """Processed plots of a tehsil, or only of one village; None if the tehsil has no GeoJSON."""
+        mtime = source_mtime(tehsil)
+        if mtime is None:
+            logger.error(f"GeoJSON file not found: {source_path(tehsil)}")
+            return None
+
+        vkey = normalize_key(village) if village is not None else None
+        with self._lock:
+            entry = self._entries.get(tehsil)
+            if entry is not None and entry.mtime != mtime:
+                logger.info(f"GeoJSON for {tehsil} changed, dropping cached geometries")
+                self._drop(tehsil)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(tehsil)
+                if vkey is None and entry.full is not None:
+                    return entry.full
+                if vkey is not None and vkey in entry.villages:
+                    return entry.villages[vkey]
+                if vkey is not None and entry.full is not None and '_village_key' in entry.full.columns:
+                    gdf = entry.full[entry.full['_village_key'] == vkey]
+                    self._add(tehsil, entry, vkey, gdf)
+                    return gdf
+
+        try:
+            gdf = self._read(tehsil, vkey)
+        except Exception as e:
+            logger.error(f"Error loading GeoJSON {source_path(tehsil)}: {str(e)}")
+            return None
+
+        with self._lock:
+            entry = self._entries.get(tehsil)
+            if entry is None or entry.mtime != mtime:
+                self._drop(tehsil)
+                entry = self._entries[tehsil] = _Entry(mtime)
+            self._add(tehsil, entry, vkey, gdf)
+        return gdf
+
+    def village_tree(self, tehsil, village=None):
+        """``(plots, STRtree)`` for one village, or the whole tehsil when ``village`` is None.
+
+        The tree is built once and lives as long as the cached plots.
+        """
+        gdf = self.get(tehsil, village)
+        if gdf is None:
+            return None, None
+        vkey = normalize_key(village) if village is not None else None
+        with self._lock:
+            entry = self._entries.get(tehsil)
+            cached = entry.trees.get(vkey) if entry is not None else None
+            if cached is not None and cached[0] is gdf:
+                return cached
+            tree = shapely.STRtree(gdf.geometry.values)
+            if entry is not None:
+                entry.trees[vkey] = (gdf, tree)
+        return gdf, tree
+
+    def _read(self, tehsil, vkey):
+        GEOMETRY_READS.inc('parquet' if HAS_PARQUET else 'geojson')
+        if not HAS_PARQUET:
+            gdf = read_source(tehsil)
+            if vkey is not None and '_village_key' in gdf.columns:
+                gdf = gdf[gdf['_village_key'] == vkey]
+            return gdf
+        path = compile_tehsil(tehsil)
+        if vkey is None:
+            return gpd.read_parquet(path)
+        try:
+            return gpd.read_parquet(path, filters=[('_village_key', '==', vkey)])
+        except Exception as e:
+            logger.warning(f"Village pushdown failed for {path}, reading it whole: {str(e)}")
+        # Never hand back (and cache under the village) plots of other villages
+        gdf = gpd.read_parquet(path)
+        if '_village_key' not in gdf.columns:
+            raise ValueError(f"{path} has no Village column, cannot select village {vkey!r}")
+        return gdf[gdf['_village_key'] == vkey]
+
+    def attachment(self, tehsil, name, build, nbytes):
+        """Derived per-tehsil data cached on the tehsil's entry; ``build()`` runs on a miss.
+
+        ``None`` results are not cached, so a later call retries the build.
+        """
+        mtime = source_mtime(tehsil)
+        if mtime is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(tehsil)
+            if entry is not None and entry.mtime == mtime and name in entry.extras:
+                self._entries.move_to_end(tehsil)
+                return entry.extras[name]
+
+        value = build()
+        if value is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(tehsil)
+            if entry is None or entry.mtime != mtime:
+                self._drop(tehsil)
+                entry = self._entries[tehsil] = _Entry(mtime)
+            if name not in entry.extras:
+                size = nbytes(value)
+                entry.extras[name] = value
+                entry.extra_nbytes += size
+                entry.nbytes += size
+                self._nbytes += size
+            self._entries.move_to_end(tehsil)
+            self._evict()
+            return entry.extras[name]
+
+    def _add(self, tehsil, entry, vkey, gdf):
+        size = _estimate_bytes(gdf)
+        if vkey is None:
+            # The whole tehsil supersedes any villages read one at a time (attachments stay)
+            self._nbytes -= entry.nbytes - entry.extra_nbytes
+            entry.full, entry.villages, entry.trees = gdf, {}, {}
+            entry.nbytes = entry.extra_nbytes
+        else:
+            entry.villages[vkey] = gdf
+        entry.nbytes += size
+        self._nbytes += size
+        self._entries.move_to_end(tehsil)
+        self._evict()
+
+    def _drop(self, tehsil):
+        entry = self._entries.pop(tehsil, None)
+        if entry is not None:
+            self._nbytes -= entry.nbytes
+
+    def _evict(self):
+        while self._nbytes > self.budget and len(self._entries) > 1:
+            tehsil, _ = next(iter(self._entries.items()))
+            logger.debug(f"Evicting cached geometries for {tehsil}")
+            self._drop(tehsil)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Compile geojson/*.geojson into village-sorted GeoParquet")
+    parser.add_argument('tehsils', nargs='*', help="tehsils to compile (default: all)")
+    parser.add_argument('--force', action='store_true')
+    args = parser.parse_args()
+    for name in args.tehsils or list_tehsils():
+        print(compile_tehsil(name, force=args.force))
@@ -0,0 +1,82 @@
+"""Compact map payloads for the Khasra callback.
+
+All plots of one kind go out as a single FeatureCollection, built with
+vectorized shapely calls instead of one ``GeoSeries.to_json`` round-trip per
+plot.  Geometries are simplified to what is visible at the zoom they will be
+shown at and coordinates are rounded to a matching number of decimals.
+Per-feature styling and popups run client-side via the functions in
+``assets/dashExtensions_default.js``.
+
+Set ``MAP_TRANSPORT=geobuf`` to ship the collections as base64 geobuf
+(``dl.GeoJSON(format="geobuf")``) instead of plain GeoJSON.
+"""
+import base64
+import json
+import math
+import os
+
+import numpy as np
+import shapely
+
+try:
+    import geobuf
+except ImportError:  # pragma: no cover - geobuf transport is optional
+    geobuf = None
+
+MAP_TRANSPORT = os.environ.get("MAP_TRANSPORT", "geojson")
+
+# Rough on-screen map width, used to guess the zoom a plot will be fitted to
+MAP_WIDTH_PX = 800
+MAX_ZOOM = 20
+
+
+# Zoom at which ``bounds`` (lon/lat) fills the map, as zoomToBounds would do
+def fit_zoom(bounds):
+    width = max(bounds[2] - bounds[0], bounds[3] - bounds[1], 1e-9)
+    return min(MAX_ZOOM, int(math.log2(MAP_WIDTH_PX * 360 / (256 * width))))
+
+
+def _degrees_per_pixel(zoom):
+    return 360 / (256 * 2 ** zoom)
+
+
+# Decimals needed to keep rounding error below a quarter of a pixel
+def precision_for_zoom(zoom):
+    return int(min(7, max(4, math.ceil(-math.log10(_degrees_per_pixel(zoom) / 4)))))
+
+
+def compact_geometries(geoms, zoom):
+    """Simplify to half a pixel and quantize coordinates for display at ``zoom``."""
+    geoms = np.asarray(geoms)
+    if zoom is None:
+        return geoms, 7
+    geoms = shapely.simplify(geoms, _degrees_per_pixel(zoom) / 2, preserve_topology=True)
+    decimals = precision_for_zoom(zoom)
+    geoms = shapely.transform(geoms, lambda coords: np.round(coords, decimals))
+    return geoms, decimals
+
+
+def feature_collection(gdf, zoom=None, properties=('Plot No.',), **constant):
+    """One FeatureCollection for every row of ``gdf``; returns ``(collection, decimals)``.
+
+    ``properties`` are copied from the columns of the same name and
+    ``constant`` keyword arguments are added to every feature.
+    """
+    geoms, decimals = compact_geometries(gdf.geometry.values, zoom)
+    columns = {name: gdf[name].tolist() for name in properties if name in gdf.columns}
+    # Let GEOS write each geometry and parse the whole collection in one go
+    geometry_json = shapely.to_geojson(geoms)
+    features = []
+    for i, geometry in enumerate(geometry_json):
+        props = {name: values[i] for name, values in columns.items()}
+        props.update(constant)
+        features.append(f'{{"type":"Feature","geometry":{geometry},"properties":{json.dumps(props)}}}')
+    collection = json.loads('{"type":"FeatureCollection","features":[' + ','.join(features) + ']}')
+    return collection, decimals
+
+
+def encode(collection, decimals=7, transport=MAP_TRANSPORT):
+    """``(data, format)`` for ``dl.GeoJSON``: plain GeoJSON, or base64 geobuf if enabled."""
+    if transport == 'geobuf' and geobuf is not None and collection['features']:
+        return base64.b64encode(geobuf.encode(collection, decimals)).decode('ascii'), 'geobuf'
+    return collection, 'geojson'
@@ -0,0 +1,189 @@
+"""Callback latency histograms and counters, exposed Prometheus-style on ``/metrics``.
+
+``@instrument('update_villages')`` times a Dash callback and counts its outcome
+(``ok``, ``prevented`` or ``error``); ``with stage('geometry_read'):`` inside
+it times one sub-stage (data load, filter, geometry read, adjacency,
+serialization) under the callback that is running.  Stages reached outside
+a callback (``/get_plot_info``, batch lookups, atlas task building) are not
+recorded unless a label is passed explicitly, as the startup data load does
+with ``stage('data_load', callback='startup')``.
+Response sizes are taken from the body Dash has already serialized for
+``/_dash-update-component``, so measuring them costs no extra encoding.
+
+Metrics live in this process only: under gunicorn each worker reports its own
+series, so scrape every worker or aggregate in Prometheus.
+"""
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+from dash.exceptions import PreventUpdate
+from flask import Blueprint, Response, g, has_request_context, request
+
+# Seconds; callbacks range from sub-millisecond dropdowns to multi-second cold geometry reads
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PAYLOAD_BUCKETS = (1 << 10, 4 << 10, 16 << 10, 64 << 10, 256 << 10, 1 << 20, 4 << 20, 16 << 20)
+
+_current_callback = contextvars.ContextVar('current_callback', default=None)
+_registry = []
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, *labels):
+        series = self._series.get(labels)
+        return sum(series[:-1]) if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in items:
+            cumulative = 0
+            for bound, hits in zip(self.buckets + ('+Inf',), series[:-1]):
+                cumulative += hits
+                le = bound if bound == '+Inf' else _format_value(float(bound))
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, [('le', le)])} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(series[-1])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}"
+
+
+CALLBACK_SECONDS = Histogram(
+    'khasra_callback_duration_seconds', "Dash callback latency.", ['callback'])
+STAGE_SECONDS = Histogram(
+    'khasra_callback_stage_duration_seconds', "Latency of one stage of a Dash callback.", ['callback', 'stage'])
+CALLBACKS = Counter(
+    'khasra_callbacks_total', "Dash callback invocations by outcome.", ['callback', 'outcome'])
+RESPONSE_BYTES = Histogram(
+    'khasra_callback_response_bytes', "Size of the Dash response body returned for a callback.", ['callback'],
+    buckets=PAYLOAD_BUCKETS)
+GEOMETRY_READS = Counter(
+    'khasra_geometry_reads_total', "Geometry reads that missed the in-process cache, by source.", ['source'])
+
+
+def instrument(name):
+    """Decorator timing a callback and counting its outcome."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            token = _current_callback.set(name)
+            if has_request_context():
+                # Lets the after-request hook label the response size
+                g.metrics_callback = name
+            start = time.perf_counter()
+            outcome = 'error'
+            try:
+                result = func(*args, **kwargs)
+                outcome = 'ok'
+                return result
+            except PreventUpdate:
+                outcome = 'prevented'
+                raise
+            finally:
+                CALLBACK_SECONDS.observe(time.perf_counter() - start, name)
+                CALLBACKS.inc(name, outcome)
+                _current_callback.reset(token)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def stage(name, callback=None):
+    """Time one stage under ``callback`` or the callback currently running (no-op outside one)."""
+    callback = callback or _current_callback.get()
+    if callback is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, callback, name)
+
+
+def exposition():
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
+
+
+def create_blueprint():
+    metrics = Blueprint('metrics', __name__)
+
+    @metrics.after_app_request
+    def record_response_size(response):
+        name = g.get('metrics_callback')
+        if name and response.status_code == 200 and request.path.endswith('/_dash-update-component'):
+            size = response.content_length
+            if size is None and not response.is_streamed:
+                size = len(response.get_data())
+            if size is not None:
+                RESPONSE_BYTES.observe(size, name)
+        return response
+
+    @metrics.route('/metrics')
+    def metrics_text():
+        return Response(exposition(), mimetype='text/plain; version=0.0.4')
+
+    return metrics
@@ -0,0 +1,97 @@
+"""Hierarchical District -> Tehsil -> Village -> Plot index over the ownership frame.
+
+Built once when the data loads.  Keys are normalized (stripped, lower-cased) so
+lookups match however the dropdown values were typed in the workbooks, option
+lists are pre-sorted and pre-rendered as Dash ``{'label', 'value'}`` dicts, and
+each plot maps straight to its row positions in the frame.  Every lookup is a
+dictionary access whose cost does not depend on how many rows are loaded.
+"""
+import re
+
+import pandas as pd
+
+_DIGITS = re.compile(r'(\d+)')
+
+
+def normalize_key(value):
+    return str(value).strip().lower()
+
+
+# Natural ordering for plot numbers: "9" < "10" < "10/2" < "10/10" < "10A"
+def natural_key(value):
+    return [int(part) if part.isdigit() else part for part in _DIGITS.split(normalize_key(value))]
+
+
+def _factorize(series):
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    labels = [str(u).strip() for u in uniques]
+    keys = [label.lower() for label in labels]
+    return codes, labels, keys
+
+
+def _options(labels, sort_key=None):
+    return [{'label': label, 'value': label} for label in sorted(labels, key=sort_key)]
+
+
+class PlotIndex:
+    def __init__(self, df):
+        self._tehsils = {}
+        self._villages = {}
+        self._plots = {}
+        self._rows = {}
+        districts = {}
+
+        if df.empty or not set(['District', 'Tehsil', 'Village', 'Plot No.']).issubset(df.columns):
+            self._districts = []
+            return
+
+        # Normalize each distinct value once instead of once per row
+        d_codes, d_labels, d_keys = _factorize(df['District'])
+        t_codes, t_labels, t_keys = _factorize(df['Tehsil'])
+        v_codes, v_labels, v_keys = _factorize(df['Village'])
+        p_codes, p_labels, p_keys = _factorize(df['Plot No.'])
+
+        tehsils, villages, plots = {}, {}, {}
+        for pos, (d, t, v, p) in enumerate(zip(d_codes, t_codes, v_codes, p_codes)):
+            if d < 0 or not d_keys[d]:
+                continue
+            dk = d_keys[d]
+            districts.setdefault(dk, d_labels[d])
+            if t < 0 or not t_keys[t]:
+                continue
+            tk = (dk, t_keys[t])
+            tehsils.setdefault(dk, {}).setdefault(tk[1], t_labels[t])
+            if v < 0 or not v_keys[v]:
+                continue
+            vk = tk + (v_keys[v],)
+            villages.setdefault(tk, {}).setdefault(vk[2], v_labels[v])
+            if p < 0 or p_keys[p] in ('', 'nan'):
+                continue
+            pk = vk + (p_keys[p],)
+            plots.setdefault(vk, {}).setdefault(pk[3], p_labels[p])
+            self._rows.setdefault(pk, []).append(pos)
+
+        self._districts = _options(districts.values())
+        self._tehsils = {k: _options(v.values()) for k, v in tehsils.items()}
+        self._villages = {k: _options(v.values()) for k, v in villages.items()}
+        self._plots = {k: _options(v.values(), sort_key=natural_key) for k, v in plots.items()}
+
+    def district_options(self):
+        return self._districts
+
+    def tehsil_options(self, district):
+        return self._tehsils.get(normalize_key(district), [])
+
+    def village_options(self, district, tehsil):
+        return self._villages.get((normalize_key(district), normalize_key(tehsil)), [])
+
+    def plot_options(self, district, tehsil, village):
+        return self._plots.get((normalize_key(district), normalize_key(tehsil), normalize_key(village)), [])
+
+    # Row positions (for ``df.iloc``) of a plot, empty if it is unknown
+    def rows(self, district, tehsil, village, plotno):
+        key = (normalize_key(district), normalize_key(tehsil), normalize_key(village), normalize_key(plotno))
+        return self._rows.get(key, [])
+
+    def __len__(self):
+        return len(self._rows)
@@ -0,0 +1,363 @@
+"""Owner-name search over the ``Plot Info`` column.
+
+Built by ``data_cache.build_cache`` for each data version and saved as a
+directory of ``.npy`` arrays that workers memory-map.  Owner names (the ``Owner Name :`` lines of
+``Plot Info``, or the whole text if there are none) are tokenized and folded
+to a transliteration-tolerant key: Devanagari is romanized, then both scripts
+go through the same phonetic folding (aspirates and doubled letters collapsed,
+w -> v, z -> j, final schwa dropped), so "Shinde", "shinde" and "शिंदे" all
+meet at ``sinde``.
+
+Folded terms map to CSR posting arrays of row positions, with a forward
+row -> terms index beside them.  A sorted term list serves prefix queries
+(typeahead) by bisection and a trigram index over the vocabulary catches
+typos.  The most selective token seeds the candidate rows (a short prefix
+expands to at most ``MAX_EXPANSION`` terms and reads only their top ``TOP_K``
+postings); the other tokens filter those rows through the forward index, so
+query cost does not grow with posting-list length.  Scores are exact > prefix
+> fuzzy weighted by idf.  A trailing token shorter than ``MIN_PREFIX`` is
+still being typed and is ignored.
+"""
+import os
+import re
+import shutil
+import tempfile
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+
+from plot_index import normalize_key
+
+OWNER_LINE = re.compile(r'Owner\s*Name\s*:\s*(.+)', re.IGNORECASE)
+TOKEN = re.compile(r'[\w\u0900-\u097F]+')  # \w alone splits at Devanagari vowel signs
+
+# Bump when the index arrays change so persisted indexes are rebuilt
+SEARCH_FORMAT = 1
+INDEX_ARRAYS = ('terms', 'post_ptr', 'post_rows', 'idf', 'row_ptr', 'row_terms',
+                'grams', 'gram_ptr', 'gram_terms', 'term_grams')
+
+# Prefix expansion cap, so a two-letter prefix cannot fan out to the whole vocabulary
+MAX_EXPANSION = 256
+MIN_PREFIX = 2
+FUZZY_THRESHOLD = 0.35
+# A token that seeds the result set on its own reads at most TOP_K rows per expanded term
+# once its expansions cover more than SEED_FULL_ROWS rows
+TOP_K = 64
+SEED_FULL_ROWS = 20000
+
+_VOWELS = {
+    'अ': 'a', 'आ': 'aa', 'इ': 'i', 'ई': 'ii', 'उ': 'u', 'ऊ': 'uu', 'ऋ': 'ru', 'ए': 'e', 'ऐ': 'ai',
+    'ओ': 'o', 'औ': 'au', 'ॲ': 'a', 'ऑ': 'o', 'ऍ': 'e',
+}
+_MATRAS = {
+    'ा': 'aa', 'ि': 'i', 'ी': 'ii', 'ु': 'u', 'ू': 'uu', 'ृ': 'ru', 'े': 'e', 'ै': 'ai',
+    'ो': 'o', 'ौ': 'au', 'ॉ': 'o', 'ॅ': 'e',
+}
+_CONSONANTS = {
+    'क': 'k', 'ख': 'kh', 'ग': 'g', 'घ': 'gh', 'ङ': 'n', 'च': 'ch', 'छ': 'chh', 'ज': 'j', 'झ': 'jh',
+    'ञ': 'n', 'ट': 't', 'ठ': 'th', 'ड': 'd', 'ढ': 'dh', 'ण': 'n', 'त': 't', 'थ': 'th', 'द': 'd',
+    'ध': 'dh', 'न': 'n', 'प': 'p', 'फ': 'ph', 'ब': 'b', 'भ': 'bh', 'म': 'm', 'य': 'y', 'र': 'r',
+    'ल': 'l', 'व': 'v', 'श': 'sh', 'ष': 'sh', 'स': 's', 'ह': 'h', 'ळ': 'l', 'क़': 'k', 'ख़': 'kh',
+    'ग़': 'g', 'ज़': 'j', 'ड़': 'd', 'ढ़': 'dh', 'फ़': 'f', 'य़': 'y',
+}
+_SIGNS = {'ं': 'n', 'ँ': 'n', 'ः': 'h', '्': '', '़': '', 'ऽ': ''}
+_DEVANAGARI_DIGITS = {chr(0x0966 + d): str(d) for d in range(10)}
+
+
+def romanize(text):
+    """Rough Devanagari -> Latin romanization (inherent 'a' after bare consonants)."""
+    out = []
+    chars = unicodedata.normalize('NFC', text.replace('ज्ञ', 'द्न्य'))
+    for i, ch in enumerate(chars):
+        if ch in _CONSONANTS:
+            out.append(_CONSONANTS[ch])
+            following = chars[i + 1] if i + 1 < len(chars) else ''
+            if following not in _MATRAS and following not in ('्', '़'):
+                out.append('a')
+        elif ch in _MATRAS:
+            out.append(_MATRAS[ch])
+        elif ch in _VOWELS:
+            out.append(_VOWELS[ch])
+        elif ch in _SIGNS:
+            out.append(_SIGNS[ch])
+        elif ch in _DEVANAGARI_DIGITS:
+            out.append(_DEVANAGARI_DIGITS[ch])
+        else:
+            out.append(ch)
+    return ''.join(out)
+
+
+def _strip_accents(text):
+    return ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+
+
+# Names repeat heavily, so folding is memoized per distinct token
+@lru_cache(maxsize=1 << 18)
+def fold(token):
+    """Transliteration-tolerant search key for one token."""
+    s = _strip_accents(romanize(token.lower()))
+    s = re.sub(r'[^a-z0-9]', '', s)
+    if s.isdigit():
+        return s
+    s = re.sub(r'([bcdfgjklmnpqrstvwxz])h', r'\1', s)
+    s = s.replace('w', 'v').replace('z', 'j').replace('q', 'k').replace('ee', 'i').replace('oo', 'u')
+    s = re.sub(r'(.)\1+', r'\1', s)
+    s = re.sub(r'm(?=[bp])', 'n', s)
+    if len(s) > 3 and s.endswith('a'):
+        s = s[:-1]
+    return s
+
+
+def owner_names(text):
+    if not isinstance(text, str):
+        return []
+    # One "Owner Name" line often lists several co-owners separated by commas
+    names = [name.strip() for line in OWNER_LINE.findall(text) for name in line.split(',') if name.strip()]
+    return names or [text]
+
+
+def _trigrams(term):
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _csr(lists, dtype=np.int32):
+    """``(ptr, values)`` for a list of integer lists: list ``i`` is ``values[ptr[i]:ptr[i + 1]]``."""
+    ptr = np.zeros(len(lists) + 1, dtype=np.int64)
+    ptr[1:] = np.cumsum([len(values) for values in lists])
+    values = np.concatenate(lists).astype(dtype) if lists else np.zeros(0, dtype=dtype)
+    return ptr, values
+
+
+def build_arrays(df, column='Plot Info'):
+    """The index as flat numpy arrays (see ``INDEX_ARRAYS``), ready to save or search."""
+    size = len(df)
+    postings = {}
+    if column in df.columns:
+        for pos, text in enumerate(df[column].tolist()):
+            for name in owner_names(text):
+                for raw in TOKEN.findall(name):
+                    term = fold(raw)
+                    if term:
+                        postings.setdefault(term, []).append(pos)
+
+    terms = sorted(postings)
+    post_ptr, post_rows = _csr([np.unique(np.asarray(postings[t], dtype=np.int32)) for t in terms])
+    counts = np.diff(post_ptr)
+
+    # Forward index (row -> term ids): later query tokens only have to test the rows already matched
+    term_of_posting = np.repeat(np.arange(len(terms), dtype=np.int32), counts)
+    row_terms = term_of_posting[np.argsort(post_rows, kind='stable')]
+    row_ptr = np.zeros(size + 1, dtype=np.int64)
+    row_ptr[1:] = np.cumsum(np.bincount(post_rows, minlength=size))
+
+    grams = {}
+    term_grams = np.zeros(len(terms), dtype=np.int32)
+    for i, term in enumerate(terms):
+        term_set = _trigrams(term)
+        term_grams[i] = len(term_set)
+        for gram in term_set:
+            grams.setdefault(gram, []).append(i)
+    gram_keys = sorted(grams)
+    gram_ptr, gram_terms = _csr([grams[g] for g in gram_keys])
+
+    return {
+        'terms': np.array(terms, dtype=str), 'post_ptr': post_ptr, 'post_rows': post_rows,
+        'idf': np.log1p(size / np.maximum(counts, 1)).astype(np.float64),
+        'row_ptr': row_ptr, 'row_terms': row_terms,
+        'grams': np.array(gram_keys, dtype=str), 'gram_ptr': gram_ptr, 'gram_terms': gram_terms,
+        'term_grams': term_grams,
+    }
+
+
+class _Token:
+    """The terms one folded query token matches: exact id, a prefix id range and fuzzy ids."""
+    def __init__(self, exact, prefix, fuzzy_ids, fuzzy_weights):
+        self.exact = exact
+        self.prefix = prefix
+        self.fuzzy_ids = fuzzy_ids
+        self.fuzzy_weights = fuzzy_weights
+
+    def __bool__(self):
+        return self.exact is not None or self.prefix is not None or len(self.fuzzy_ids) > 0
+
+
+class OwnerSearchIndex:
+    def __init__(self, df, column='Plot Info', arrays=None):
+        self.df = df
+        self.size = len(df)
+        arrays = build_arrays(df, column) if arrays is None else arrays
+        for name in INDEX_ARRAYS:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def load(cls, path, df):
+        """Open an index written by ``save``; the arrays are memory-mapped and shared between workers."""
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r') for name in INDEX_ARRAYS}
+        if len(arrays['row_ptr']) != len(df) + 1:
+            raise ValueError(f"search index {path} does not match the loaded data")
+        return cls(df, arrays=arrays)
+
+    def save(self, path):
+        tmp = tempfile.mkdtemp(dir=os.path.dirname(path) or '.', prefix=".tmp-")
+        try:
+            for name in INDEX_ARRAYS:
+                np.save(os.path.join(tmp, f"{name}.npy"), np.asarray(getattr(self, name)))
+            os.chmod(tmp, 0o755)
+            os.replace(tmp, path)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+    def __len__(self):
+        return len(self.terms)
+
+    def _posting(self, term, limit=None):
+        start, end = self.post_ptr[term], self.post_ptr[term + 1]
+        return self.post_rows[start:end if limit is None else min(end, start + limit)]
+
+    def _token(self, token, prefix):
+        lo = int(np.searchsorted(self.terms, token, 'left'))
+        exact = lo if lo < len(self.terms) and self.terms[lo] == token else None
+        span = None
+        if prefix and len(token) >= MIN_PREFIX:
+            # Terms are sorted, so everything starting with the token is one contiguous id range
+            hi = int(np.searchsorted(self.terms, token + '\U0010ffff', 'left'))
+            if hi > lo:
+                span = (lo, hi)
+        fuzzy_ids, fuzzy_weights = np.zeros(0, dtype=np.int64), np.zeros(0)
+        if exact is None and span is None and len(token) >= 3:
+            grams = _trigrams(token)
+            hits = []
+            for gram in grams:
+                j = int(np.searchsorted(self.grams, gram))
+                if j < len(self.grams) and self.grams[j] == gram:
+                    hits.append(self.gram_terms[self.gram_ptr[j]:self.gram_ptr[j + 1]])
+            if hits:
+                ids, shared = np.unique(np.concatenate(hits), return_counts=True)
+                sim = shared / (len(grams) + self.term_grams[ids] - shared)
+                keep = sim >= FUZZY_THRESHOLD
+                fuzzy_ids, fuzzy_weights = ids[keep].astype(np.int64), 0.5 * sim[keep]
+        return _Token(exact, span, fuzzy_ids, fuzzy_weights)
+
+    # Weight of each term id for a token (0 where the term does not match it)
+    def _weights(self, token, term_ids):
+        weights = np.zeros(len(term_ids))
+        if token.prefix is not None:
+            weights[(term_ids >= token.prefix[0]) & (term_ids < token.prefix[1])] = 0.7
+        if len(token.fuzzy_ids):
+            j = np.minimum(np.searchsorted(token.fuzzy_ids, term_ids), len(token.fuzzy_ids) - 1)
+            match = token.fuzzy_ids[j] == term_ids
+            weights[match] = np.maximum(weights[match], token.fuzzy_weights[j[match]])
+        if token.exact is not None:
+            weights[term_ids == token.exact] = 1.0
+        return weights * self.idf[term_ids]
+
+    def _estimate(self, token):
+        rows = 0
+        if token.prefix is not None:
+            rows += int(self.post_ptr[token.prefix[1]] - self.post_ptr[token.prefix[0]])
+        elif token.exact is not None:
+            rows += int(self.post_ptr[token.exact + 1] - self.post_ptr[token.exact])
+        if len(token.fuzzy_ids):
+            rows += int((self.post_ptr[token.fuzzy_ids + 1] - self.post_ptr[token.fuzzy_ids]).sum())
+        return rows
+
+    # Rows (and scores) one token matches on its own, to start the AND from
+    def _seed(self, token):
+        terms = []
+        if token.exact is not None:
+            terms.append(token.exact)
+        if token.prefix is not None:
+            span = np.arange(*token.prefix)
+            if len(span) > MAX_EXPANSION:
+                # Most frequent completions first: they are what a half-typed name most likely means
+                counts = self.post_ptr[span + 1] - self.post_ptr[span]
+                span = span[np.argpartition(-counts, MAX_EXPANSION)[:MAX_EXPANSION]]
+            terms.extend(int(t) for t in span if t != token.exact)
+        terms.extend(int(t) for t in token.fuzzy_ids)
+        # Only the exact term is always read in full; expansions fall back to top-k postings when large
+        limit = None if self._estimate(token) <= SEED_FULL_ROWS else TOP_K
+        lists = [self._posting(t, None if t == token.exact else limit) for t in terms]
+        ids = np.concatenate(lists)
+        weights = np.concatenate([np.full(len(rows), w) for rows, w in
+                                  zip(lists, self._weights(token, np.asarray(terms, dtype=np.int64)))])
+        # Best matching term per row
+        order = np.lexsort((-weights, ids))
+        ids, weights = ids[order], weights[order]
+        first = np.concatenate(([True], ids[1:] != ids[:-1]))
+        return ids[first].astype(np.int64), weights[first]
+
+    # Keep the rows that also match ``token``, adding its best term weight per row
+    def _filter(self, rows, scores, token):
+        starts = self.row_ptr[rows]
+        lengths = self.row_ptr[rows + 1] - starts
+        total = int(lengths.sum())
+        if not total:
+            return rows[:0], scores[:0]
+        owner = np.repeat(np.arange(len(rows)), lengths)
+        offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        weights = self._weights(token, self.row_terms[np.repeat(starts, lengths) + offsets].astype(np.int64))
+        best = np.zeros(len(rows))
+        np.maximum.at(best, owner, weights)
+        keep = best > 0
+        return rows[keep], scores[keep] + best[keep]
+
+    def search(self, query, limit=10):
+        """Top ``(row position, score)`` pairs; the last query token is matched as a prefix."""
+        tokens = [t for t in (fold(raw) for raw in TOKEN.findall(str(query or ''))) if t]
+        # A word just started (shorter than MIN_PREFIX) is not typed yet: do not let it empty the results
+        if tokens and len(tokens[-1]) < MIN_PREFIX:
+            tokens = tokens[:-1]
+        if not tokens or not len(self.terms):
+            return []
+        matched = [self._token(token, prefix=(n == len(tokens) - 1)) for n, token in enumerate(tokens)]
+        if not all(matched):
+            return []
+        # Start from the most selective token; the others only test the rows it matched
+        matched.sort(key=self._estimate)
+        rows, scores = self._seed(matched[0])
+        for token in matched[1:]:
+            if not len(rows):
+                return []
+            rows, scores = self._filter(rows, scores, token)
+        if not len(rows):
+            return []
+        top = np.argsort(-scores, kind='stable')[:limit] if len(rows) <= limit else \
+            np.argpartition(-scores, limit)[:limit]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+    def best_owner(self, pos, query, column='Plot Info'):
+        """The owner name of a row that best matches ``query`` (for result labels)."""
+        names = owner_names(self.df[column].iat[pos])
+        wanted = [w for w in (fold(t) for t in TOKEN.findall(str(query))) if w]
+        best, best_hits = names[0] if names else '', -1
+        for name in names:
+            terms = [fold(t) for t in TOKEN.findall(name)]
+            hits = sum(any(term.startswith(w) for term in terms) for w in wanted)
+            if hits > best_hits:
+                best, best_hits = name, hits
+                if hits == len(wanted):
+                    break
+        return best
+
+    def results(self, query, limit=10):
+        """Search hits as plot keys with the matching owner name, best first."""
+        columns = [self.df[c] for c in ('District', 'Tehsil', 'Village', 'Plot No.')]
+        seen = set()
+        out = []
+        for pos, score in self.search(query, limit * 2):
+            key = tuple(str(col.iat[pos]) for col in columns)
+            normalized = tuple(normalize_key(k) for k in key)
+            if normalized in seen:
+                continue
+            seen.add(normalized)
+            out.append({
+                'district': key[0], 'tehsil': key[1], 'village': key[2], 'plotno': key[3],
+                'owner': self.best_owner(pos, query), 'score': round(score, 3),
+            })
+            if len(out) == limit:
+                break
+        return out
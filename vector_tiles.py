@@ -0,0 +1,307 @@
+"""Mapbox Vector Tiles of whole-tehsil parcel overlays, served from the Flask server.
+
+``GET /tiles/{tehsil}/{z}/{x}/{y}.pbf`` cuts the tehsil's parcels (from the
+``GeometryStore``, via its cached tehsil STRtree) to the tile, simplifies them
+to the tile grid and encodes a single ``parcels`` layer with ``plot`` and
+``village`` properties.  Tiles are cached in memory (LRU) and on disk under
+``{TILE_CACHE_DIR}/{tehsil}/{version}/``, where the version is the GeoJSON's
+mtime, and are served with an ETag and Cache-Control so browsers revalidate
+cheaply.  ``python vector_tiles.py seed TEHSIL --minzoom 12 --maxzoom 17``
+pre-renders a zoom range.
+
+The encoder is a small hand-written protobuf writer for the MVT 2.1 subset we
+need (polygons, string properties), so no extra tile library is required.
+"""
+import argparse
+import logging
+import math
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import shapely
+from flask import Blueprint, Response, abort, request
+from shapely.geometry.polygon import orient
+
+from data_cache import write_atomic
+from geometry_store import source_mtime
+
+logger = logging.getLogger(__name__)
+
+TILE_CACHE_DIR = os.environ.get("TILE_CACHE_DIR", os.path.join("cache", "tiles"))
+TILE_CACHE_SIZE = int(os.environ.get("TILE_CACHE_SIZE", 4096))
+TILE_MIN_ZOOM = 10
+TILE_MAX_ZOOM = 20
+TILE_MAX_AGE = int(os.environ.get("TILE_MAX_AGE", 3600))
+
+EXTENT = 4096
+BUFFER = 64
+LAYER_NAME = "parcels"
+MVT_MIMETYPE = "application/vnd.mapbox-vector-tile"
+
+
+# --- Minimal protobuf / MVT encoding --------------------------------------
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _key(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+
+def _bytes_field(field, payload):
+    return _key(field, 2) + _varint(len(payload)) + payload
+
+
+def _packed(field, values):
+    return _bytes_field(field, b''.join(_varint(v) for v in values))
+
+
+def _zigzag(n):
+    return (n << 1) ^ (n >> 31)
+
+
+def _command(cmd, count):
+    return (cmd & 0x7) | (count << 3)
+
+
+def _ring_commands(coords, cursor):
+    # Drop repeated points (common after snapping to the tile grid) and the closing vertex
+    points = [tuple(p) for p in coords[:-1]]
+    points = [p for i, p in enumerate(points) if i == 0 or p != points[i - 1]]
+    if len(points) < 3:
+        return [], cursor
+    out = [_command(1, 1)]
+    x, y = points[0]
+    out += [_zigzag(x - cursor[0]), _zigzag(y - cursor[1])]
+    cursor = (x, y)
+    out.append(_command(2, len(points) - 1))
+    for x, y in points[1:]:
+        out += [_zigzag(x - cursor[0]), _zigzag(y - cursor[1])]
+        cursor = (x, y)
+    out.append(_command(7, 1))
+    return out, cursor
+
+
+def _polygon_commands(geom):
+    commands, cursor = [], (0, 0)
+    parts = geom.geoms if geom.geom_type == 'MultiPolygon' else [geom]
+    for part in parts:
+        # MVT wants exterior rings with positive area in tile space (y down)
+        part = orient(part, sign=1.0)
+        ring, cursor = _ring_commands(np.asarray(part.exterior.coords, dtype=np.int64), cursor)
+        if not ring:
+            continue
+        commands += ring
+        for interior in part.interiors:
+            hole, cursor = _ring_commands(np.asarray(interior.coords, dtype=np.int64), cursor)
+            commands += hole
+    return commands
+
+
+def encode_layer(geoms, properties, name=LAYER_NAME, extent=EXTENT):
+    """Encode polygons already in tile coordinates as one MVT layer; returns the tile bytes."""
+    keys, values = {}, {}
+    features = []
+    for fid, (geom, props) in enumerate(zip(geoms, properties), start=1):
+        if geom is None or geom.is_empty or geom.geom_type not in ('Polygon', 'MultiPolygon'):
+            continue
+        commands = _polygon_commands(geom)
+        if not commands:
+            continue
+        tags = []
+        for k, v in props.items():
+            if v is None:
+                continue
+            tags.append(keys.setdefault(k, len(keys)))
+            tags.append(values.setdefault(str(v), len(values)))
+        feature = _key(1, 0) + _varint(fid) + _packed(2, tags) + _key(3, 0) + _varint(3) + _packed(4, commands)
+        features.append(_bytes_field(2, feature))
+    if not features:
+        return b''
+
+    layer = _key(15, 0) + _varint(2) + _bytes_field(1, name.encode())
+    layer += b''.join(features)
+    layer += b''.join(_bytes_field(3, k.encode()) for k in keys)
+    layer += b''.join(_bytes_field(4, _bytes_field(1, v.encode())) for v in values)
+    layer += _key(5, 0) + _varint(extent)
+    return _bytes_field(3, layer)
+
+
+# --- Tile maths ------------------------------------------------------------
+
+def tile_bounds(z, x, y):
+    """(west, south, east, north) of a slippy-map tile in degrees."""
+    n = 2 ** z
+    west = x / n * 360 - 180
+    east = (x + 1) / n * 360 - 180
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return west, south, east, north
+
+
+def tiles_for_bounds(bounds, z):
+    west, south, east, north = bounds
+    n = 2 ** z
+
+    def tile_xy(lon, lat):
+        lat = max(min(lat, 85.0511), -85.0511)
+        tx = int((lon + 180) / 360 * n)
+        ty = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+        return min(max(tx, 0), n - 1), min(max(ty, 0), n - 1)
+
+    x0, y0 = tile_xy(west, north)
+    x1, y1 = tile_xy(east, south)
+    for tx in range(x0, x1 + 1):
+        for ty in range(y0, y1 + 1):
+            yield tx, ty
+
+
+def _to_tile_coords(z, x, y):
+    scale = 2 ** z * EXTENT
+
+    def project(coords):
+        lon, lat = coords[:, 0], np.clip(coords[:, 1], -85.0511, 85.0511)
+        px = (lon + 180) / 360 * scale - x * EXTENT
+        py = (1 - np.arcsinh(np.tan(np.radians(lat))) / np.pi) / 2 * scale - y * EXTENT
+        return np.round(np.column_stack([px, py]))
+    return project
+
+
+def render_tile(plots, tree, z, x, y):
+    """MVT bytes for one tile of a tehsil's plots (empty bytes if nothing intersects)."""
+    west, south, east, north = tile_bounds(z, x, y)
+    pad_x = (east - west) * BUFFER / EXTENT
+    pad_y = (north - south) * BUFFER / EXTENT
+    hits = tree.query(shapely.box(west - pad_x, south - pad_y, east + pad_x, north + pad_y), predicate='intersects')
+    if not len(hits):
+        return b''
+    hits.sort()
+    geoms = shapely.transform(plots.geometry.values[hits], _to_tile_coords(z, x, y))
+    # Half a screen pixel at 256px tiles
+    geoms = shapely.simplify(geoms, EXTENT / 512, preserve_topology=True)
+    geoms = shapely.clip_by_rect(geoms, -BUFFER, -BUFFER, EXTENT + BUFFER, EXTENT + BUFFER)
+    subset = plots.iloc[hits]
+    props = [
+        {'plot': plot, 'village': village}
+        for plot, village in zip(subset['Plot No.'],
+                                 subset['Village'] if 'Village' in subset.columns else [None] * len(subset))
+    ]
+    return encode_layer(geoms, props)
+
+
+# --- Caching ---------------------------------------------------------------
+
+class TileCache:
+    def __init__(self, geometry_store, cache_dir=TILE_CACHE_DIR, size=TILE_CACHE_SIZE):
+        self.geometry_store = geometry_store
+        self.cache_dir = cache_dir
+        self.size = size
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Tile version: changes whenever the tehsil's GeoJSON does
+    def version(self, tehsil):
+        mtime = source_mtime(tehsil)
+        return None if mtime is None else format(mtime, 'x')
+
+    def _disk_path(self, tehsil, version, z, x, y):
+        return os.path.join(self.cache_dir, tehsil, version, str(z), str(x), f"{y}.pbf")
+
+    def get(self, tehsil, z, x, y, version=None):
+        version = version or self.version(tehsil)
+        if version is None:
+            return None
+        key = (tehsil, version, z, x, y)
+        with self._lock:
+            if key in self._tiles:
+                self._tiles.move_to_end(key)
+                return self._tiles[key]
+
+        path = self._disk_path(tehsil, version, z, x, y)
+        try:
+            with open(path, 'rb') as fh:
+                data = fh.read()
+        except OSError:
+            plots, tree = self.geometry_store.village_tree(tehsil)
+            if plots is None:
+                return None
+            data = render_tile(plots, tree, z, x, y)
+            self._write(tehsil, version, path, data)
+
+        with self._lock:
+            self._tiles[key] = data
+            while len(self._tiles) > self.size:
+                self._tiles.popitem(last=False)
+        return data
+
+    def _write(self, tehsil, version, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_atomic(path, lambda fh: fh.write(data))
+        # Tiles of older GeoJSON versions are never requested again
+        tehsil_dir = os.path.join(self.cache_dir, tehsil)
+        for old in os.listdir(tehsil_dir):
+            if old != version:
+                shutil.rmtree(os.path.join(tehsil_dir, old), ignore_errors=True)
+
+    def seed(self, tehsil, minzoom, maxzoom):
+        plots, _ = self.geometry_store.village_tree(tehsil)
+        if plots is None:
+            raise SystemExit(f"No GeoJSON for tehsil {tehsil}")
+        count = 0
+        for z in range(minzoom, maxzoom + 1):
+            for x, y in tiles_for_bounds(plots.total_bounds, z):
+                self.get(tehsil, z, x, y)
+                count += 1
+            logger.info(f"Seeded {tehsil} up to zoom {z} ({count} tiles)")
+        return count
+
+
+def create_blueprint(tile_cache):
+    tiles = Blueprint('tiles', __name__)
+
+    @tiles.route('/tiles/<tehsil>/<int:z>/<int:x>/<int:y>.pbf')
+    def parcel_tile(tehsil, z, x, y):
+        if not TILE_MIN_ZOOM <= z <= TILE_MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            abort(404)
+        version = tile_cache.version(tehsil)
+        if version is None:
+            abort(404)
+        etag = f"{version}-{z}-{x}-{y}"
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            data = tile_cache.get(tehsil, z, x, y, version)
+            if data is None:
+                abort(404)
+            response = Response(data, mimetype=MVT_MIMETYPE)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = f"public, max-age={TILE_MAX_AGE}"
+        return response
+
+    return tiles
+
+
+if __name__ == '__main__':
+    from geometry_store import GeometryStore
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Pre-render parcel vector tiles into the disk cache")
+    sub = parser.add_subparsers(dest='command', required=True)
+    seed = sub.add_parser('seed')
+    seed.add_argument('tehsil')
+    seed.add_argument('--minzoom', type=int, default=12)
+    seed.add_argument('--maxzoom', type=int, default=17)
+    args = parser.parse_args()
+    print(TileCache(GeometryStore()).seed(args.tehsil, max(args.minzoom, TILE_MIN_ZOOM), min(args.maxzoom, TILE_MAX_ZOOM)))